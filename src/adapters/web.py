@@ -2,16 +2,19 @@ from fastapi import FastAPI
 from loguru import logger
 from rich.pretty import pprint
 from starlette.middleware import Middleware
-from starlette.requests import Request
-from starlette.staticfiles import StaticFiles
 
 from lifespan import lifespan
-from router import alembic_router, login_router
+from router import alembic_router, api_router, internal_probe_router, internal_router, login_router
 from router.web import web_router
 from settings import Settings, get_settings
 from utils.commit_session_middleware import CommitDatabaseSessionMiddleware
+from utils.compression_middleware import CompressionMiddleware
+from utils.jinja2_templates import JinjaTemplates
 from utils.loguru_logger import replace_log_handlers
-from utils.session_middleware import SessionMiddleware
+from utils.session_backends import MemorySessionBackend, RedisSessionBackend
+from utils.session_cache import MissCache
+from utils.session_middleware import LoadedSession, SessionMiddleware
+from utils.static_files import AssetStaticFiles
 from utils.timing_middleware import add_timing_middleware
 
 
@@ -28,12 +31,49 @@ def create_web_app():
             traces_sample_rate=1.0 if settings.debug else 0.0,
         )
 
+    if settings.session_backend == "memory":
+        session_backend = MemorySessionBackend()
+    else:
+        session_backend = RedisSessionBackend(
+            key_prefix=settings.session_key_prefix,
+            index_prefix=settings.session_index_prefix,
+            miss_cache=MissCache(maxsize=settings.session_miss_cache_size, ttl=settings.session_miss_cache_ttl),
+        )
+
+    compression_options = {}
+    if settings.compression_media_types is not None:
+        compression_options["media_types"] = settings.compression_media_types
+
     middlewares = [
-        Middleware(SessionMiddleware, secret_key=settings.secret_key, path="/", session_cookie="session_id"),
+        # outermost, so it sees the final headers including the session cookie
+        Middleware(
+            CompressionMiddleware,
+            minimum_size=settings.compression_minimum_size,
+            gzip_level=settings.compression_gzip_level,
+            brotli_quality=settings.compression_brotli_quality,
+            zstd_level=settings.compression_zstd_level,
+            **compression_options,
+        ),
+        Middleware(
+            SessionMiddleware,
+            secret_key=settings.secret_key,
+            path="/",
+            session_cookie="session_id",
+            sliding_expiry=settings.session_sliding_expiry,
+            touch_interval=settings.session_touch_interval,
+            lazy=settings.session_lazy,
+            exclude_paths=settings.session_exclude_paths,
+            cookie_max_bytes=settings.session_cookie_max_bytes,
+            cookie_compress=settings.session_cookie_compress,
+            backend=session_backend,
+        ),
         Middleware(CommitDatabaseSessionMiddleware),
     ]
 
     app = FastAPI(debug=settings.debug, lifespan=lifespan, middleware=middlewares)
+    app.state.session_backend = session_backend
+    # set by the lifespan once the pools are warmed up
+    app.state.ready = False
 
     logger.info("Debug mode: {}", settings.debug)
 
@@ -41,15 +81,18 @@ def create_web_app():
         add_timing_middleware(app, record=logger.opt(depth=3).debug, prefix="", exclude="StaticFiles")
 
     app.include_router(alembic_router, prefix="/alembic", tags=["alembic"])
+    app.include_router(api_router, prefix="/api", tags=["api"])
+    app.include_router(internal_probe_router, prefix="/internal", tags=["internal"])
+    app.include_router(internal_router, prefix="/internal", tags=["internal"])
     app.include_router(web_router, include_in_schema=False)
     app.include_router(login_router, include_in_schema=False)
-    app.mount("/static", StaticFiles(directory=settings.static_folder), name="static")
+    app.mount("/static", AssetStaticFiles(directory=settings.static_folder, manifest=JinjaTemplates.asset_manifest()), name="static")
 
     @app.get("/test")
-    def test(request: Request):
-        pprint(request.session)
-        value = request.session.get("test", 0)
-        request.session["test"] = value + 1
+    def test(session: LoadedSession):
+        pprint(session)
+        value = session.get("test", 0)
+        session["test"] = value + 1
         return {"status": "ok", "value": value}
 
     return app
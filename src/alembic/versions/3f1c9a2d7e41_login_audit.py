@@ -0,0 +1,35 @@
+"""login audit
+
+Revision ID: 3f1c9a2d7e41
+Revises: b5524c74ef80
+Create Date: 2026-10-18 18:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a2d7e41'
+down_revision = 'b5524c74ef80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('login_audit',
+    sa.Column('id', sa.Uuid(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+    sa.Column('user_id', sa.Uuid(), nullable=False),
+    sa.Column('service', sa.String(), nullable=False),
+    sa.Column('ip', sa.String(), nullable=True),
+    sa.Column('user_agent', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_login_audit_user_id_user'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_login_audit'))
+    )
+    op.create_index(op.f('ix_login_audit_user_id'), 'login_audit', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_login_audit_user_id'), table_name='login_audit')
+    op.drop_table('login_audit')
@@ -0,0 +1,23 @@
+"""user last_login index
+
+Revision ID: 8d2e4b6a1c93
+Revises: 3f1c9a2d7e41
+Create Date: 2026-10-18 18:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e4b6a1c93'
+down_revision = '3f1c9a2d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_user_last_login_id', 'user', ['last_login', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_user_last_login_id', table_name='user')
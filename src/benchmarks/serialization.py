@@ -0,0 +1,44 @@
+"""
+Compares model-to-dict paths for `User`, run from `src` with `python -m benchmarks.serialization`.
+Needs no database, rows are built in memory.
+"""
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy.engine.result import result_tuple
+
+from db.models import User
+from db.models.user import CachedUser
+from db.serialization import dumps, models_to_dicts, rows_to_dicts
+
+N = 10_000
+REPEAT = 5
+
+
+def _column_walk(obj):
+    # the previous Base.to_dict
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+
+def main():
+    now = datetime.now(timezone.utc)
+    users = [User(id=uuid.uuid4(), email=f"user{i}@example.com", active=True, last_login=now) for i in range(N)]
+    make_row = result_tuple(["id", "email", "active", "last_login"])
+    rows = [make_row((user.id, user.email, user.active, user.last_login)) for user in users]
+
+    cases = {
+        "column walk": lambda: [_column_walk(user) for user in users],
+        "pydantic from_attributes": lambda: [CachedUser.model_validate(user).model_dump() for user in users],
+        "Base.to_dict": lambda: [user.to_dict() for user in users],
+        "models_to_dicts": lambda: models_to_dicts(users),
+        "rows_to_dicts": lambda: rows_to_dicts(rows),
+        "rows_to_dicts + dumps": lambda: dumps(rows_to_dicts(rows)),
+    }
+    for name, case in cases.items():
+        best = min(timeit.repeat(case, number=1, repeat=REPEAT))
+        print(f"{name:<26} {best * 1000:8.2f} ms / {N} users  {best / N * 1e6:6.2f} us each")
+
+
+if __name__ == "__main__":
+    main()
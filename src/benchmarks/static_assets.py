@@ -0,0 +1,48 @@
+"""
+Bytes and requests per page view for the assets referenced by `base.html`, plain versus precompressed and immutable.
+Run from `src` with `python -m benchmarks.static_assets [static folder]` after building the frontend.
+"""
+import gzip
+import sys
+from pathlib import Path
+
+import orjson
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+STATIC_FOLDER = Path(__file__).resolve().parents[2] / "static"
+PAGE_ASSETS = ("vendors.js", "main.js", "main.css", "icons.css")
+
+
+def _size(path: Path, suffix: str, compress) -> int:
+    sibling = path.with_name(path.name + suffix)
+    return sibling.stat().st_size if sibling.exists() else len(compress(path.read_bytes()))
+
+
+def main(static_folder: Path = STATIC_FOLDER):
+    folder = static_folder / "frontend"
+    manifest = orjson.loads((folder / "assets-manifest.json").read_bytes())
+    totals = {"identity": 0, "gzip": 0, "br": 0}
+    print(f"{'asset':<12} {'identity':>10} {'gzip':>10} {'br':>10}")
+    for name in PAGE_ASSETS:
+        path = folder / manifest[name]
+        sizes = {
+            "identity": path.stat().st_size,
+            "gzip": _size(path, ".gz", lambda data: gzip.compress(data, compresslevel=9)),
+            "br": _size(path, ".br", lambda data: brotli.compress(data, quality=11)) if brotli else 0,
+        }
+        for encoding, size in sizes.items():
+            totals[encoding] += size
+        print(f"{name:<12} {sizes['identity']:>10} {sizes['gzip']:>10} {sizes['br'] or '-':>10}")
+    print(f"{'total':<12} {totals['identity']:>10} {totals['gzip']:>10} {totals['br'] or '-':>10}")
+    best = totals["br"] or totals["gzip"]
+    print(f"first view: {totals['identity'] - best} bytes saved ({1 - best / totals['identity']:.0%})")
+    # without Cache-Control every repeat view revalidates each asset, immutable assets come from the browser cache
+    print(f"repeat view: {len(PAGE_ASSETS)} conditional requests saved, {len(PAGE_ASSETS)} -> 0")
+
+
+if __name__ == "__main__":
+    main(Path(sys.argv[1]) if len(sys.argv) > 1 else STATIC_FOLDER)
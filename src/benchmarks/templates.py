@@ -0,0 +1,71 @@
+"""
+Measures the cold first render of every template in a fresh environment, compiled from source versus loaded from a
+warm `FileSystemBytecodeCache`, split into loading the template and rendering it, plus the render once the template
+is loaded. Run from `src` with `python -m benchmarks.templates`.
+"""
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+import jinja2
+
+TEMPLATE_FOLDER = Path(__file__).resolve().parents[2] / "templates"
+REPEAT = 20
+
+
+class _Request:
+    """
+    The parts of a starlette request the templates use.
+    """
+
+    user = None
+    session = {"test": 1}
+
+    @staticmethod
+    def url_for(name: str, **path_params) -> str:
+        return "/".join((f"/{name}", *map(str, path_params.values())))
+
+
+CONTEXT = {"request": _Request(), "settings": {"brand_color": "#336699"}, "backends": ["google"], "name": "World"}
+
+
+def _cold_render(loop: asyncio.AbstractEventLoop, bytecode_cache: jinja2.BytecodeCache | None) -> dict[str, tuple[float, float, float]]:
+    """
+    Returns load, first render and warm render time per template.
+    """
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_FOLDER), enable_async=True, bytecode_cache=bytecode_cache)
+    env.filters["asset"] = str
+    timings = {}
+    for name in env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        start = time.perf_counter()
+        template = env.get_template(name)
+        loaded = time.perf_counter()
+        # the first render also loads the templates this one extends or includes
+        loop.run_until_complete(template.render_async(CONTEXT))
+        rendered = time.perf_counter()
+        loop.run_until_complete(template.render_async(CONTEXT))
+        timings[name] = (loaded - start, rendered - loaded, time.perf_counter() - rendered)
+    return timings
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+        _cold_render(loop, bytecode_cache)  # fill the cache
+        cases = {"compile": None, "bytecode cache": bytecode_cache}
+        results = {name: [_cold_render(loop, cache) for _ in range(REPEAT)] for name, cache in cases.items()}
+    loop.close()
+    for name, runs in results.items():
+        print(name)
+        print(f"  {'template':<24} {'load':>10} {'render':>10} {'first':>10} {'warm':>10}")
+        for template in sorted(runs[0]):
+            load, render, warm = (min(run[template][column] for run in runs) for column in range(3))
+            print(f"  {template:<24} {load * 1000:7.2f} ms {render * 1000:7.2f} ms {(load + render) * 1000:7.2f} ms {warm * 1000:7.2f} ms")
+        first = min(sum(load + render for load, render, _ in run.values()) for run in runs)
+        print(f"  {'total first render':<24} {first * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
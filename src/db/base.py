@@ -1,7 +1,10 @@
+import operator
+from collections.abc import Callable
 from datetime import datetime
+from typing import Any, ClassVar
 
-from sqlalchemy import DateTime, MetaData
-from sqlalchemy.orm import DeclarativeBase, registry
+from sqlalchemy import DateTime, MetaData, event
+from sqlalchemy.orm import DeclarativeBase, Mapper, registry
 
 meta = MetaData(
     naming_convention={
@@ -24,5 +27,21 @@ class Base(DeclarativeBase):
         },
     )
 
+    # column names and a getter returning the column attribute values as a tuple, set once the mapper is configured
+    __column_accessor__: ClassVar[tuple[tuple[str, ...], Callable[[Any], tuple]]]
+
     def to_dict(self):
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        names, getter = self.__column_accessor__
+        return dict(zip(names, getter(self)))
+
+
+@event.listens_for(Base, "mapper_configured", propagate=True)
+def _compile_column_accessor(mapper: Mapper, cls: type[Base]) -> None:
+    keys = [attribute.key for attribute in mapper.column_attrs]
+    # orjson only accepts exact str keys, column names may be quoted_name
+    names = tuple(str(attribute.columns[0].name) for attribute in mapper.column_attrs)
+    if len(keys) == 1:
+        key = keys[0]
+        cls.__column_accessor__ = (names, lambda obj: (getattr(obj, key),))
+    else:
+        cls.__column_accessor__ = (names, operator.attrgetter(*keys))
@@ -7,7 +7,7 @@ from fastapi import Depends
 from fastapi.requests import Request
 from sqlalchemy.ext.asyncio import AsyncSession as _AsyncSession
 
-from .engine import async_session_factory
+from .engine import async_session_factory, fallback_read_only_session_factory, read_only_session_factory, replica_health
 from .redis import get_redis_connection
 
 
@@ -23,6 +23,18 @@ async def create_session() -> AsyncIterator[_AsyncSession]:
         yield session
 
 
+async def get_read_only_session() -> AsyncIterator[_AsyncSession]:
+    # not registered on request.state, so CommitDatabaseSessionMiddleware never commits it
+    factory = read_only_session_factory if replica_health.is_usable() else fallback_read_only_session_factory
+    async with factory() as session:
+        yield session
+
+
+create_read_only_session = contextlib.asynccontextmanager(get_read_only_session)
+
+
 AsyncSession = Annotated[_AsyncSession, Depends(get_session)]
 
+ReadOnlySession = Annotated[_AsyncSession, Depends(get_read_only_session)]
+
 Redis = Annotated[redis.Redis, Depends(get_redis_connection)]
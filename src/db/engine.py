@@ -1,22 +1,109 @@
-from orjson import orjson
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+import asyncio
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 
 from settings import DatabaseSettings, get_settings
 
+from .pool import InstrumentedAsyncAdaptedQueuePool, instrument_engine
+from .replica import ReplicaHealth
+from .serialization import dumps
+
 _settings = get_settings(DatabaseSettings)
 
 
 def orjson_serializer(obj):
-    return orjson.dumps(obj, option=orjson.OPT_NAIVE_UTC).decode()
+    return dumps(obj).decode()
 
 
-async_engine = create_async_engine(
-    _settings.url,
-    pool_size=20,
-    pool_pre_ping=True,
-    pool_use_lifo=True,
-    echo=_settings.echo,
-    json_serializer=orjson_serializer,
-)
+def _create_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        pool_size=_settings.pool_size,
+        max_overflow=_settings.max_overflow,
+        pool_timeout=_settings.pool_timeout,
+        pool_recycle=_settings.pool_recycle,
+        pool_use_lifo=True,
+        echo=_settings.echo,
+        json_serializer=orjson_serializer,
+    )
+    instrument_engine(engine, pre_ping_idle=_settings.pool_pre_ping_idle)
+    return engine
+
+
+async_engine = _create_engine(_settings.url)
 
 async_session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+replica_engine = _create_engine(_settings.replica_url) if _settings.replica_url else None
+
+# READ ONLY transactions, so a write sent to a read only session fails instead of reaching the primary fallback
+read_only_session_factory = async_sessionmaker(
+    bind=(replica_engine or async_engine).execution_options(postgresql_readonly=True), expire_on_commit=False
+)
+
+fallback_read_only_session_factory = async_sessionmaker(
+    bind=async_engine.execution_options(postgresql_readonly=True), expire_on_commit=False
+)
+
+replica_health = ReplicaHealth(
+    replica_engine,
+    max_lag=_settings.replica_max_lag,
+    check_interval=_settings.replica_check_interval,
+    probe_timeout=_settings.replica_probe_timeout,
+)
+
+
+def _engines() -> list[AsyncEngine]:
+    return [async_engine] if replica_engine is None else [async_engine, replica_engine]
+
+
+async def _warm_up_engine(engine: AsyncEngine, connections: int) -> None:
+    async def open_connection(opened: list):
+        connection = await engine.connect()
+        opened.append(connection)
+        await connection.execute(text("SELECT 1"))
+
+    opened = []
+    try:
+        await asyncio.gather(*(open_connection(opened) for _ in range(min(connections, _settings.pool_size))))
+    finally:
+        # returned only after all were opened, otherwise the pool would hand out the same connection again
+        for connection in opened:
+            await connection.close()
+    logger.info("Warmed up {} database connections to {}", len(opened), engine.url.host)
+
+
+async def warm_up_engines(connections: int = _settings.pool_warmup_connections) -> None:
+    """
+    Opens `connections` pooled connections per engine at once and runs a query on each, so connection setup and
+    asyncpg's type introspection happen before the first request instead of during it.
+
+    Startup fails if the primary can't be reached. The replica gets `replica_probe_timeout` seconds, if it isn't
+    reachable by then it is marked unhealthy and reads use the primary until the health check sees it again.
+    """
+    await _warm_up_engine(async_engine, connections)
+    if replica_engine is None:
+        return
+    try:
+        await asyncio.wait_for(_warm_up_engine(replica_engine, connections), timeout=_settings.replica_probe_timeout)
+    except (OSError, SQLAlchemyError, asyncio.TimeoutError) as exc:
+        logger.warning("Could not warm up the replica, reading from primary: {!r}", exc)
+        replica_health.healthy = False
+
+
+async def dispose_engines() -> None:
+    for engine in _engines():
+        await engine.dispose()
+
+
+def get_pool_stats() -> dict[str, dict[str, int | float]]:
+    stats = {"primary": async_engine.sync_engine.pool.telemetry.stats(async_engine.sync_engine.pool)}
+    if replica_engine is not None:
+        stats["replica"] = replica_engine.sync_engine.pool.telemetry.stats(replica_engine.sync_engine.pool)
+        stats["replica"]["healthy"] = replica_health.healthy
+        stats["replica"]["lag"] = replica_health.lag
+    return stats
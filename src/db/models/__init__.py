@@ -1,4 +1,5 @@
+from .login_audit import LoginAudit
 from .social_auth import UserSocialAuth
 from .user import User
 
-__all__ = ["User", "UserSocialAuth"]
+__all__ = ["LoginAudit", "User", "UserSocialAuth"]
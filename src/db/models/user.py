@@ -1,8 +1,8 @@
 from datetime import datetime
 from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict
-from sqlalchemy import UUID as SAUUID, text
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import UUID as SAUUID, Index, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from db import Base
@@ -10,6 +10,10 @@ from db import Base
 
 class User(Base):
     __tablename__ = "user"
+    __table_args__ = (
+        # keyset pagination of the user listing, see UserListService
+        Index("ix_user_last_login_id", "last_login", "id"),
+    )
 
     id: Mapped[str] = mapped_column(SAUUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
 
@@ -24,6 +28,7 @@ class User(Base):
 
 class CachedUser(BaseModel):
     id: UUID
+    email: str | None = None
 
     model_config = ConfigDict(from_attributes=True)
-    loaded_at: datetime = datetime.utcnow()
+    loaded_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,144 @@
+import time
+
+from loguru import logger
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+__all__ = ["InstrumentedAsyncAdaptedQueuePool", "PoolTelemetry", "instrument_engine"]
+
+
+class PoolTelemetry:
+    """
+    Counters for one engine's connection pool, filled by `InstrumentedAsyncAdaptedQueuePool` and the pool events
+    registered in `instrument_engine`.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.connect_time = 0.0
+        self.max_connect_time = 0.0
+        self.checkout_time = 0.0
+        self.max_checkout_time = 0.0
+        self.peak_overflow = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.pings = 0
+
+    def stats(self, pool: AsyncAdaptedQueuePool) -> dict[str, int | float]:
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "peak_overflow": self.peak_overflow,
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 6),
+            "max_wait_time": round(self.max_wait_time, 6),
+            "avg_checkout_time": round(self.checkout_time / self.checkouts, 6) if self.checkouts else 0.0,
+            "max_checkout_time": round(self.max_checkout_time, 6),
+            "connects": self.connects,
+            "avg_connect_time": round(self.connect_time / self.connects, 6) if self.connects else 0.0,
+            "max_connect_time": round(self.max_connect_time, 6),
+            "closes": self.closes,
+            "invalidations": self.invalidations,
+            "pings": self.pings,
+        }
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long callers waited for a connection once the pool and its overflow were exhausted,
+    and how long opening new connections took.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.telemetry = PoolTelemetry()
+        creator = self._invoke_creator
+
+        def timed_creator(connection_record):
+            start = time.perf_counter()
+            try:
+                return creator(connection_record)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.telemetry.connect_time += elapsed
+                self.telemetry.max_connect_time = max(self.telemetry.max_connect_time, elapsed)
+
+        # every connect goes through here, also the reconnects of invalidated connections
+        self._invoke_creator = timed_creator
+
+    def _do_get(self):
+        # same condition QueuePool uses to block, below the overflow limit a new connection is opened instead
+        if self.checkedin() or self._max_overflow == -1 or self._overflow < self._max_overflow:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.telemetry.waits += 1
+            self.telemetry.wait_time += elapsed
+            self.telemetry.max_wait_time = max(self.telemetry.max_wait_time, elapsed)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.telemetry = self.telemetry
+        return pool
+
+
+def instrument_engine(engine: AsyncEngine, *, pre_ping_idle: float | None = None) -> None:
+    """
+    Registers the pool events that track checkout duration, overflow and connection churn.
+
+    With `pre_ping_idle` set, connections that sat idle in the pool for longer than that many seconds are pinged on
+    checkout, instead of pinging on every checkout like `pool_pre_ping` does.
+    """
+    sync_engine = engine.sync_engine
+
+    def telemetry() -> PoolTelemetry:
+        return sync_engine.pool.telemetry
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(_dbapi_connection, _connection_record):
+        telemetry().connects += 1
+
+    @event.listens_for(sync_engine, "close")
+    def on_close(_dbapi_connection, _connection_record):
+        telemetry().closes += 1
+
+    @event.listens_for(sync_engine, "invalidate")
+    def on_invalidate(_dbapi_connection, _connection_record, _exception):
+        telemetry().invalidations += 1
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, _connection_proxy):
+        now = time.monotonic()
+        stats = telemetry()
+        stats.checkouts += 1
+        stats.peak_overflow = max(stats.peak_overflow, sync_engine.pool.overflow())
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if pre_ping_idle is not None and checked_in_at is not None and now - checked_in_at > pre_ping_idle:
+            stats.pings += 1
+            try:
+                sync_engine.dialect.do_ping(dbapi_connection)
+            except Exception as e:  # pylint: disable=broad-except
+                logger.info("Idle connection failed ping, reconnecting: {}", e)
+                # the pool discards this connection and retries the checkout with a new one
+                raise exc.DisconnectionError() from e
+        connection_record.info["checked_out_at"] = now
+
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(_dbapi_connection, connection_record):
+        now = time.monotonic()
+        if (checked_out_at := connection_record.info.pop("checked_out_at", None)) is not None:
+            stats = telemetry()
+            stats.checkout_time += now - checked_out_at
+            stats.max_checkout_time = max(stats.max_checkout_time, now - checked_out_at)
+        connection_record.info["checked_in_at"] = now
@@ -1,9 +1,113 @@
+import asyncio
+import time
+
 import redis.asyncio as redis
+from loguru import logger
 
 from settings import Settings, get_settings
 
+__all__ = [
+    "InstrumentedConnectionPool",
+    "close_redis_pool",
+    "create_redis_pool",
+    "get_redis_connection",
+    "get_redis_pool_stats",
+    "warm_up_redis_pool",
+]
+
 _settings = get_settings(Settings)
 
 
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Blocking connection pool that keeps track of how often callers had to wait for a free connection.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+
+    async def get_connection(self, *args, **kwargs):
+        if not self._available_connections and len(self._in_use_connections) >= self.max_connections:
+            self.waits += 1
+            start = time.perf_counter()
+            try:
+                return await super().get_connection(*args, **kwargs)
+            finally:
+                self.wait_time += time.perf_counter() - start
+        return await super().get_connection(*args, **kwargs)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "max_connections": self.max_connections,
+            "in_use": len(self._in_use_connections),
+            "idle": len(self._available_connections),
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 6),
+        }
+
+
+_pool: InstrumentedConnectionPool | None = None
+_client: redis.Redis | None = None
+
+
+async def create_redis_pool() -> redis.Redis:
+    """
+    Creates the process wide connection pool and the client sharing it. Called once from the lifespan.
+    """
+    global _pool, _client  # pylint: disable=global-statement
+    if _client is None:
+        _pool = InstrumentedConnectionPool.from_url(
+            str(_settings.redis_url),
+            decode_responses=True,
+            max_connections=_settings.redis_max_connections,
+            timeout=_settings.redis_pool_timeout,
+            socket_timeout=_settings.redis_socket_timeout,
+            socket_connect_timeout=_settings.redis_socket_connect_timeout,
+            health_check_interval=_settings.redis_health_check_interval,
+        )
+        _client = redis.Redis(connection_pool=_pool)
+    return _client
+
+
+async def warm_up_redis_pool(connections: int = _settings.redis_warmup_connections) -> None:
+    """
+    Opens `connections` pooled connections at once and pings each before the first request needs them.
+    """
+    if _pool is None:
+        raise RuntimeError("Redis is not initialized")
+    opened = []
+
+    async def open_connection():
+        connection = await _pool.get_connection("PING")
+        opened.append(connection)
+        await connection.send_command("PING")
+        await connection.read_response()
+
+    try:
+        await asyncio.gather(*(open_connection() for _ in range(min(connections, _settings.redis_max_connections))))
+    finally:
+        for connection in opened:
+            await _pool.release(connection)
+    logger.info("Warmed up {} redis connections", len(opened))
+
+
+async def close_redis_pool() -> None:
+    global _pool, _client  # pylint: disable=global-statement
+    if _pool is not None:
+        await _pool.disconnect()
+    _pool = None
+    _client = None
+
+
 async def get_redis_connection() -> redis.Redis:
-    return redis.Redis.from_url(str(_settings.redis_url), decode_responses=True)
+    if _client is None:
+        raise RuntimeError("Redis is not initialized")
+    return _client
+
+
+def get_redis_pool_stats() -> dict[str, int | float]:
+    if _pool is None:
+        return {}
+    return _pool.stats()
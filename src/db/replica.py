@@ -0,0 +1,72 @@
+import asyncio
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+__all__ = ["ReplicaHealth"]
+
+# replay lag in seconds, 0 when the replica has replayed everything it received (an idle primary isn't lag)
+_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicaHealth:
+    """
+    Decides whether read only sessions may use the replica. A background task started from the lifespan probes it
+    every `check_interval` seconds, so requests never wait for the probe. The replica is skipped while it is
+    unreachable, doesn't answer within `probe_timeout` seconds or lags more than `max_lag` seconds.
+    """
+
+    def __init__(self, engine: AsyncEngine | None, *, max_lag: float = 5.0, check_interval: float = 5.0, probe_timeout: float = 2.0):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.probe_timeout = probe_timeout
+        self.healthy = engine is not None
+        self.lag: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def is_usable(self) -> bool:
+        return self.engine is not None and self.healthy
+
+    async def start(self) -> None:
+        if self.engine is None:
+            return
+        await self._check()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self._check()
+
+    async def _probe(self) -> float:
+        async with self.engine.connect() as connection:
+            return float((await connection.execute(_LAG_QUERY)).scalar_one())
+
+    async def _check(self) -> None:
+        try:
+            self.lag = await asyncio.wait_for(self._probe(), timeout=self.probe_timeout)
+        except (OSError, SQLAlchemyError, asyncio.TimeoutError) as exc:
+            if self.healthy:
+                logger.warning("Replica unreachable, reading from primary: {!r}", exc)
+            self.healthy = False
+            self.lag = None
+            return
+        healthy = self.lag <= self.max_lag
+        if healthy != self.healthy:
+            logger.warning("Replica lag {:.1f}s, {} reads", self.lag, "resuming replica" if healthy else "falling back to primary for")
+        self.healthy = healthy
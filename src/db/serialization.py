@@ -0,0 +1,39 @@
+import functools
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import orjson
+from sqlalchemy.engine import Result, Row
+
+from db.base import Base
+
+__all__ = ["dumps", "models_to_dicts", "rows_to_dicts"]
+
+# naive datetimes are treated as UTC, UUIDs and aware datetimes are handled natively by orjson
+dumps: Callable[[Any], bytes] = functools.partial(orjson.dumps, option=orjson.OPT_NAIVE_UTC)
+
+
+def models_to_dicts(objs: Iterable[Base]) -> list[dict[str, Any]]:
+    """
+    Converts ORM instances of one mapped class with its precompiled column accessor, see `Base.to_dict`.
+    """
+    objs = list(objs)
+    if not objs:
+        return []
+    names, getter = objs[0].__column_accessor__
+    return [dict(zip(names, getter(obj))) for obj in objs]
+
+
+def rows_to_dicts(rows: Result | Iterable[Row]) -> list[dict[str, Any]]:
+    """
+    Converts Core rows, e.g. from `select(User.id, User.email)` or `select(User.__table__)`, without hydrating ORM
+    instances.
+    """
+    if isinstance(rows, Result):
+        names = [str(key) for key in rows.keys()]
+        return [dict(zip(names, row)) for row in rows]
+    rows = list(rows)
+    if not rows:
+        return []
+    names = [str(key) for key in rows[0]._fields]
+    return [dict(zip(names, row)) for row in rows]
@@ -0,0 +1,167 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from settings import Settings, get_settings
+
+from .engine import async_engine
+
+__all__ = ["LoginEvent", "LoginEventBuffer", "login_event_buffer"]
+
+_settings = get_settings(Settings)
+
+_UPDATE_LAST_LOGIN = text(
+    """
+    UPDATE "user" SET last_login = v.last_login
+    FROM (SELECT unnest(CAST(:ids AS uuid[])) AS id, unnest(CAST(:last_logins AS timestamptz[])) AS last_login) AS v
+    WHERE "user".id = v.id AND "user".last_login < v.last_login
+    """
+)
+
+_AUDIT_COLUMNS = ("user_id", "service", "ip", "user_agent", "created_at")
+
+
+@dataclass
+class LoginEvent:
+    user_id: UUID
+    service: str
+    ip: str | None
+    user_agent: str | None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class LoginEventBuffer:
+    """
+    Write-behind buffer for login side effects.
+
+    Events are collected in memory and flushed when `batch_size` events are pending or the oldest one is
+    `flush_interval` seconds old. A flush is one `UPDATE ... FROM unnest(...)` of `user.last_login` plus a `COPY`
+    into `login_audit`, in one transaction. Pending events are flushed on `stop`. A failed batch is queued again
+    unless that would exceed `max_pending`, in which case it is dropped and counted.
+    """
+
+    def __init__(self, engine: AsyncEngine, *, batch_size: int = 500, flush_interval: float = 2.0, max_pending: int = 50_000):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: list[LoginEvent] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.flushed_events = 0
+        self.failed_flushes = 0
+        self.dropped_events = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def record(self, event: LoginEvent) -> None:
+        self._pending.append(event)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_events": self.flushed_events,
+            "failed_flushes": self.failed_flushes,
+            "dropped_events": self.dropped_events,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "last_lag": round(self.last_lag, 3),
+            "max_lag": round(self.max_lag, 3),
+        }
+
+    async def start(self) -> None:
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # not cancelled, a flush in progress is finished before the loop ends
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                break
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                return
+            if not await self.flush():
+                # back off instead of retrying a failing database in a tight loop
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def flush(self) -> bool:
+        async with self._flush_lock:
+            batch, self._pending = self._pending[: self.batch_size], self._pending[self.batch_size :]
+            if not batch:
+                return True
+            try:
+                await self._write(batch)
+            except asyncio.CancelledError:
+                # keep the batch for the final flush in stop
+                self._pending[:0] = batch
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                self.failed_flushes += 1
+                if len(self._pending) + len(batch) <= self.max_pending:
+                    logger.warning("Flushing {} login events failed, retrying later: {}", len(batch), exc)
+                    self._pending[:0] = batch
+                else:
+                    logger.error("Flushing {} login events failed, dropping them: {}", len(batch), exc)
+                    self.dropped_events += len(batch)
+                return False
+            lag = time.monotonic() - batch[0].queued_at
+            self.flushes += 1
+            self.flushed_events += len(batch)
+            self.last_batch_size = len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+            return True
+
+    async def _write(self, batch: list[LoginEvent]) -> None:
+        last_logins: dict[UUID, datetime] = {}
+        for event in batch:
+            last_logins[event.user_id] = max(event.created_at, last_logins.get(event.user_id, event.created_at))
+        async with self.engine.begin() as connection:
+            await connection.execute(_UPDATE_LAST_LOGIN, {"ids": list(last_logins), "last_logins": list(last_logins.values())})
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                "login_audit",
+                records=[(e.user_id, e.service, e.ip, e.user_agent, e.created_at) for e in batch],
+                columns=_AUDIT_COLUMNS,
+            )
+
+
+login_event_buffer = LoginEventBuffer(
+    async_engine,
+    batch_size=_settings.login_events_batch_size,
+    flush_interval=_settings.login_events_flush_interval,
+)
@@ -0,0 +1,23 @@
+import hmac
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from starlette import status
+
+from settings import Settings, get_settings
+
+__all__ = ["require_internal_token"]
+
+_settings = get_settings(Settings)
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+async def require_internal_token(credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)) -> None:
+    """
+    Guards the ops endpoints with `Authorization: Bearer <internal_token>`. Without a configured token they are closed.
+    """
+    if not _settings.internal_token:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Internal API is disabled")
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), _settings.internal_token.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, headers={"WWW-Authenticate": "Bearer"})
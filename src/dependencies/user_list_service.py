@@ -0,0 +1,66 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Annotated, Any
+from uuid import UUID
+
+import orjson
+from fastapi import Depends
+from sqlalchemy import exists, func, select, tuple_
+
+from db.dependencies import ReadOnlySession
+from db.models import User, UserSocialAuth
+from db.serialization import rows_to_dicts
+
+
+class UserListService:
+    """
+    Lists users newest login first with keyset pagination over `(last_login, id)`, backed by `ix_user_last_login_id`.
+    Every page is an index range scan of `limit` rows, no matter how deep it is.
+    """
+
+    class InvalidCursor(Exception):
+        pass
+
+    def __init__(self, session: ReadOnlySession) -> None:
+        self._session = session
+
+    @staticmethod
+    def encode_cursor(last_login: datetime, user_id: UUID) -> str:
+        return base64.urlsafe_b64encode(orjson.dumps([last_login, user_id])).rstrip(b"=").decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> tuple[datetime, UUID]:
+        try:
+            last_login, user_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            return datetime.fromisoformat(last_login), UUID(user_id)
+        except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError) as e:
+            raise cls.InvalidCursor(cursor) from e
+
+    async def list_users(
+        self, *, limit: int, cursor: str | None = None, service: str | None = None, active: bool | None = None
+    ) -> tuple[list[dict[str, Any]], str | None]:
+        """
+        Returns one page of users with the services they are linked to, and the cursor of the next page if any.
+        """
+        services = select(func.array_agg(UserSocialAuth.service)).where(UserSocialAuth.user_id == User.id).scalar_subquery()
+        stmt = (
+            select(User.id, User.email, User.active, User.last_login, services.label("services"))
+            .order_by(User.last_login.desc(), User.id.desc())
+            .limit(limit + 1)
+        )
+        if cursor:
+            stmt = stmt.where(tuple_(User.last_login, User.id) < tuple_(*self.decode_cursor(cursor)))
+        if service is not None:
+            stmt = stmt.where(exists().where(UserSocialAuth.user_id == User.id, UserSocialAuth.service == service))
+        if active is not None:
+            stmt = stmt.where(User.active.is_(active))
+        rows = (await self._session.execute(stmt)).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1].last_login, rows[-1].id)
+        return rows_to_dicts(rows), next_cursor
+
+
+UserListServiceDependency = Annotated[UserListService, Depends(UserListService)]
@@ -0,0 +1,62 @@
+import hashlib
+import time
+from typing import Annotated
+from uuid import UUID
+
+from fastapi import Depends
+
+from db.dependencies import Redis
+from settings import Settings, get_settings
+
+_settings = get_settings(Settings)
+
+# Deletes every session listed in the user's index together with the index itself, atomically on the server.
+_REVOKE_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, -1)
+for _, id in ipairs(ids) do
+    redis.call('DEL', ARGV[1] .. id)
+end
+redis.call('DEL', KEYS[1])
+return #ids
+"""
+
+
+class UserSessionService:
+    """
+    Lists and revokes the redis sessions of a user through the per-user index maintained by `SessionDict`.
+    Sessions kept in signed cookies are not indexed and can't be revoked server side.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self._redis = redis
+
+    @staticmethod
+    def _index_key(user_id: UUID | str) -> str:
+        return f"{_settings.session_index_prefix}{user_id}"
+
+    @staticmethod
+    def session_handle(session_id: str) -> str:
+        """
+        Non-secret handle of a session. Session ids are the cookie values and must never be handed out.
+        """
+        return hashlib.sha256(session_id.encode()).hexdigest()
+
+    async def list_sessions(self, user_id: UUID | str) -> list[dict[str, str | float]]:
+        """
+        Returns a handle and the expiry timestamp of every live session of the user.
+        """
+        index = self._index_key(user_id)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(index, "-inf", time.time())
+            pipe.zrange(index, 0, -1, withscores=True)
+            _, sessions = await pipe.execute()
+        return [{"handle": self.session_handle(session_id), "expires_at": expires_at} for session_id, expires_at in sessions]
+
+    async def revoke_all(self, user_id: UUID | str) -> int:
+        """
+        Deletes all sessions of the user in one call, returns how many were revoked.
+        """
+        return await self._redis.eval(_REVOKE_SCRIPT, 1, self._index_key(user_id), _settings.session_key_prefix)
+
+
+UserSessionServiceDependency = Annotated[UserSessionService, Depends(UserSessionService)]
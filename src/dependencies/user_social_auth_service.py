@@ -1,17 +1,18 @@
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from typing import Annotated
 
 from fastapi import Depends
-from orjson import orjson
 from pydantic import BaseModel, EmailStr
-from rich.pretty import pprint
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError, NoResultFound
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
 
-from db.dependencies import AsyncSession
+from db.dependencies import AsyncSession, create_read_only_session
 from db.models import User, UserSocialAuth
 from db.models.user import CachedUser
+from settings import Settings, get_settings
+
+_settings = get_settings(Settings)
 
 
 class UserInfo(BaseModel):
@@ -21,6 +22,38 @@ class UserInfo(BaseModel):
     locale: str
 
 
+# Login or sign up in one round trip, also when two first logins of the same (service, sub) race:
+# - existing: the social auth is already known, return its user. last_login of known users is written behind in
+#   batches by `db.write_behind.login_event_buffer`.
+# - new_user: otherwise insert the user. A concurrent first login makes this conflict on the email, DO UPDATE then
+#   waits for the other transaction and returns its committed user.
+# - new_auth: link the social auth. In the racing case the (service, sub) conflict returns the winner's row. A user
+#   that merely shares the email with an already linked account is not linked, so nothing is returned.
+_LOGIN_STATEMENT = text(
+    """
+    WITH existing AS (
+        SELECT user_id FROM user_social_auth WHERE service = :service AND sub = :sub
+    ), known_user AS (
+        SELECT "user".id, "user".email, "user".active FROM "user" JOIN existing ON "user".id = existing.user_id
+    ), new_user AS (
+        INSERT INTO "user" (email, last_login)
+        SELECT :email, now() WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (email) DO UPDATE SET last_login = "user".last_login
+        RETURNING id, email, active, xmax = 0 AS inserted
+    ), new_auth AS (
+        INSERT INTO user_social_auth (user_id, service, sub, name, email, locale)
+        SELECT id, :service, :sub, :name, :email, :locale FROM new_user
+        WHERE inserted OR NOT EXISTS (SELECT 1 FROM user_social_auth WHERE user_id = new_user.id)
+        ON CONFLICT (service, sub) DO UPDATE SET name = EXCLUDED.name
+        RETURNING user_id
+    )
+    SELECT id, email, active FROM known_user
+    UNION ALL
+    SELECT new_user.id, new_user.email, new_user.active FROM new_user JOIN new_auth ON new_auth.user_id = new_user.id
+    """
+)
+
+
 class UserService:
     class CouldNotCreateUser(Exception):
         pass
@@ -28,6 +61,9 @@ class UserService:
     class UserDisabled(Exception):
         pass
 
+    # decoded users keyed by the serialized value stored in the session, so a changed value never hits a stale entry
+    _user_cache: OrderedDict[str, CachedUser] = OrderedDict()
+
     def __init__(self, session: AsyncSession) -> None:
         self._session = session
 
@@ -36,37 +72,62 @@ class UserService:
         return (await self._session.execute(stmt)).scalar_one()
 
     async def login_or_create_user(self, *, service: str, userinfo: UserInfo) -> CachedUser:
-        stmt = select(UserSocialAuth).filter_by(service=service, sub=userinfo.sub).options(joinedload(UserSocialAuth.user))
+        """
+        Logs in or creates the user in a single statement, see `_LOGIN_STATEMENT`.
+        """
         try:
-            instance = (await self._session.execute(stmt)).scalar_one()
-            if not instance.user.active:
-                raise self.UserDisabled()
-            return CachedUser.model_validate(instance)
-        except NoResultFound:
-            user = User(email=userinfo.email)
-            instance = UserSocialAuth(service=service, user=user, **userinfo.model_dump())
-            try:
-                self._session.add(user)
-                self._session.add(instance)
-                await self._session.commit()
-                return CachedUser.model_validate(instance)
-            except IntegrityError as e:
+            row = (await self._session.execute(_LOGIN_STATEMENT, {"service": service, **userinfo.model_dump()})).one_or_none()
+            if row is not None and not row.active:
+                # don't keep a social auth the statement just linked to a disabled user with the same email
                 await self._session.rollback()
-                try:
-                    instance = (await self._session.execute(stmt)).scalar_one()
-                    if not instance.user.active:
-                        raise self.UserDisabled()
-                    return CachedUser.model_validate(instance)
-                except NoResultFound:
-                    raise self.CouldNotCreateUser from e
+                raise self.UserDisabled()
+            await self._session.commit()
+        except IntegrityError as e:
+            await self._session.rollback()
+            raise self.CouldNotCreateUser from e
+        if row is None:
+            raise self.CouldNotCreateUser()
+        return CachedUser(id=row.id, email=row.email)
 
     @classmethod
-    async def load_user_from_session(cls, session_data: str) -> CachedUser | None:
-        obj = orjson.loads(session_data)
-        user = CachedUser.model_validate(obj)
-        pprint(user)
-        print(datetime.utcnow() - user.loaded_at)
+    async def load_user_from_session(cls, session: dict) -> CachedUser | None:
+        """
+        Resolves the user stored in the session, decoding it at most once per worker.
+
+        Once the cached user is older than `user_freshness_seconds` it is checked against the database. Disabled or
+        deleted users are removed from the session, otherwise the refreshed user is written back to it.
+        """
+        if not (user_data := session.get("user")):
+            return None
+        if (user := cls._user_cache.get(user_data)) is not None:
+            cls._user_cache.move_to_end(user_data)
+        else:
+            user = cls._cache_user(user_data, CachedUser.model_validate_json(user_data))
+
+        if datetime.utcnow() - user.loaded_at > timedelta(seconds=_settings.user_freshness_seconds):
+            if (user := await cls._revalidate(user)) is None:
+                session.pop("user")
+                return None
+            user_data = user.model_dump_json()
+            cls._cache_user(user_data, user)
+            session["user"] = user_data
+        return user
+
+    @classmethod
+    def _cache_user(cls, user_data: str, user: CachedUser) -> CachedUser:
+        cls._user_cache[user_data] = user
+        while len(cls._user_cache) > _settings.user_cache_size:
+            cls._user_cache.popitem(last=False)
         return user
 
+    @classmethod
+    async def _revalidate(cls, user: CachedUser) -> CachedUser | None:
+        async with create_read_only_session() as session:
+            stmt = select(User.active, User.email).where(User.id == user.id)
+            row = (await session.execute(stmt)).one_or_none()
+        if row is None or not row.active:
+            return None
+        return user.model_copy(update={"email": row.email, "loaded_at": datetime.utcnow()})
+
 
 UserServiceDependency = Annotated[UserService, Depends(UserService)]
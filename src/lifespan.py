@@ -1,16 +1,46 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
-from db.redis import get_redis_connection
+from db.engine import dispose_engines, replica_health, warm_up_engines
+from db.redis import close_redis_pool, create_redis_pool, warm_up_redis_pool
+from db.write_behind import login_event_buffer
+from settings import Settings, get_settings
 from utils.jinja2_templates import JinjaTemplates
-from utils.session_middleware import SessionDict
+from utils.session_backends import RedisSessionBackend
+from utils.session_cache import SessionCache
+
+_settings = get_settings(Settings)
 
 
 @asynccontextmanager
-async def lifespan(_: FastAPI):
-    await SessionDict.initialize(redis=await get_redis_connection())
+async def lifespan(app: FastAPI):
+    # Initialize the shared redis connection pool and the session backend with its optional local cache
+    redis = await create_redis_pool()
+    # Open pooled connections before the first request instead of during it. Only the redis session backend requires
+    # redis, the other users of it degrade without it, so the memory backend also starts while redis is unreachable.
+    uses_redis = isinstance(app.state.session_backend, RedisSessionBackend)
+    await asyncio.gather(*([warm_up_redis_pool()] if uses_redis else []), warm_up_engines())
+    session_cache = None
+    if uses_redis and _settings.session_cache_enabled:
+        session_cache = SessionCache(maxsize=_settings.session_cache_size, ping_interval=_settings.session_cache_ping_interval)
+        await session_cache.start(str(_settings.redis_url), _settings.session_key_prefix)
+    await app.state.session_backend.initialize(redis, cache=session_cache)
     # Initialize Templates
     JinjaTemplates.initialize()
+    # Probe the replica in the background, read only sessions only look at the last result
+    await replica_health.start()
+    # Start the write-behind buffer for login events
+    await login_event_buffer.start()
     # Start Application
+    app.state.ready = True
     yield
+    # Shutdown, flushing pending login events before the pools go away
+    app.state.ready = False
+    await login_event_buffer.stop()
+    await replica_health.stop()
+    if session_cache:
+        await session_cache.stop()
+    await close_redis_pool()
+    await dispose_engines()
@@ -1,4 +1,7 @@
 from .alembic import router as alembic_router
+from .api import router as api_router
+from .internal import probe_router as internal_probe_router
+from .internal import router as internal_router
 from .login import router as login_router
 
-__all__ = ["login_router", "alembic_router"]
+__all__ = ["login_router", "alembic_router", "api_router", "internal_probe_router", "internal_router"]
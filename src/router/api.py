@@ -0,0 +1,28 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from starlette import status
+
+from dependencies.internal_auth import require_internal_token
+from dependencies.user_list_service import UserListServiceDependency
+
+# lists every user's email and anyone with a google account can log in, so like the internal endpoints it needs the
+# internal token instead of a login
+router = APIRouter(dependencies=[Depends(require_internal_token)], default_response_class=ORJSONResponse)
+
+
+@router.get("/users")
+async def list_users(
+    service: UserListServiceDependency,
+    limit: Annotated[int, Query(ge=1, le=200)] = 50,
+    cursor: Annotated[str | None, Query()] = None,
+    social_service: Annotated[str | None, Query(alias="service")] = None,
+    active: Annotated[bool | None, Query()] = None,
+):
+    try:
+        users, next_cursor = await service.list_users(limit=limit, cursor=cursor, service=social_service, active=active)
+    except service.InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    # returned as a response so the rows are serialized by orjson directly, without a pydantic pass
+    return ORJSONResponse({"users": users, "next_cursor": next_cursor})
@@ -0,0 +1,90 @@
+from typing import Annotated, Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Query
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+
+from db.engine import get_pool_stats
+from db.models import User, UserSocialAuth
+from db.redis import get_redis_pool_stats
+from db.write_behind import login_event_buffer
+from dependencies.internal_auth import require_internal_token
+from dependencies.user_session_service import UserSessionServiceDependency
+from settings import Settings, get_settings
+from utils.page_cache import page_cache
+from utils.session_middleware import SessionDict
+from utils.table_export import ExportFormat, export_table, gzip_chunks
+
+_settings = get_settings(Settings)
+
+_export_tables = {"user": User.__table__, "user_social_auth": UserSocialAuth.__table__}
+
+_export_media_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+router = APIRouter(dependencies=[Depends(require_internal_token)])
+
+# load balancer probes, the only internal endpoint without a token
+probe_router = APIRouter()
+
+
+@probe_router.get("/ready")
+async def ready(request: Request):
+    if not request.app.state.ready:
+        return JSONResponse({"ready": False}, status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return {"ready": True}
+
+
+@router.get("/redis")
+async def redis_stats():
+    return get_redis_pool_stats()
+
+
+@router.get("/db")
+async def db_stats():
+    return get_pool_stats()
+
+
+@router.get("/login-events")
+async def login_event_stats():
+    return login_event_buffer.stats()
+
+
+@router.get("/page-cache")
+async def page_cache_stats():
+    return page_cache.stats()
+
+
+@router.delete("/page-cache/tags/{tag}")
+async def invalidate_page_cache_tag(tag: str):
+    return {"invalidated": await page_cache.invalidate(tag)}
+
+
+@router.get("/sessions")
+async def session_stats(request: Request):
+    return {"cookies": SessionDict.counters, "backend": request.app.state.session_backend.stats()}
+
+
+@router.get("/users/{user_id}/sessions")
+async def user_sessions(user_id: UUID, service: UserSessionServiceDependency):
+    return await service.list_sessions(user_id)
+
+
+@router.delete("/users/{user_id}/sessions")
+async def revoke_user_sessions(user_id: UUID, service: UserSessionServiceDependency):
+    return {"revoked": await service.revoke_all(user_id)}
+
+
+@router.get("/export/{table}")
+async def export(
+    table: Literal["user", "user_social_auth"],
+    export_format: Annotated[ExportFormat, Query(alias="format")] = "ndjson",
+    gzip: bool = False,
+):
+    chunks = export_table(_export_tables[table], export_format, batch_size=_settings.export_batch_size)
+    filename = f"{table}.{export_format}"
+    media_type = _export_media_types[export_format]
+    if gzip:
+        chunks, filename, media_type = gzip_chunks(chunks), filename + ".gz", "application/gzip"
+    return StreamingResponse(chunks, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
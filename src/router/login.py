@@ -3,26 +3,29 @@ from typing import Annotated
 
 from authlib.integrations.base_client import OAuthError
 from authlib.integrations.starlette_client import OAuth
-from fastapi import APIRouter, HTTPException, Path
+from fastapi import APIRouter, Depends, HTTPException, Path
 from starlette import status
 from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from starlette.websockets import WebSocket
 
 from db.models import User
+from db.write_behind import LoginEvent, login_event_buffer
 from dependencies.user_social_auth_service import UserServiceDependency
 from settings import AuthSettings, get_settings
 from utils.jinja2_templates import Template
 from utils.oauth.discord import Discord, Google, OAuthBase
+from utils.page_cache import cached_page
+from utils.session_middleware import LoadedSession, load_session
 
 _settings = get_settings(AuthSettings)
 
 _backends: {str: OAuthBase} = {"google": Google, "discord": Discord}
 
-router = APIRouter(prefix="/auth")
+router = APIRouter(prefix="/auth", dependencies=[Depends(load_session)])
 
 
-async def login_required(request: Request = None, websocket: WebSocket = None) -> User | None:
+async def login_required(_: LoadedSession, request: Request = None, websocket: WebSocket = None) -> User | None:
     if websocket:
         return None
     if request and request.user:
@@ -31,6 +34,7 @@ async def login_required(request: Request = None, websocket: WebSocket = None) -
 
 
 @router.get("/")
+@cached_page(ttl=300, tags=("login",))
 async def login(template: Template):
     return await template("auth/login.html", backends=_backends)
 
@@ -73,6 +77,14 @@ async def authorize(request: Request, backend: Annotated[str, Path(...)], user_a
         userinfo = backend_obj.normalize_userinfo(raw_userinfo)
 
         social_user = await user_auth_service.login_or_create_user(service=backend_obj.service, userinfo=userinfo)
+        login_event_buffer.record(
+            LoginEvent(
+                user_id=social_user.id,
+                service=backend_obj.service,
+                ip=request.client.host if request.client else None,
+                user_agent=request.headers.get("user-agent"),
+            )
+        )
         redirect_url = request.session.get("login_redirect", "/")
         request.session.clear()
         request.session["user"] = social_user.model_dump_json()
@@ -1,6 +1,6 @@
 import os
 from functools import lru_cache
-from typing import TypeVar
+from typing import Literal, TypeVar
 from urllib.parse import quote_plus
 
 import dotenv
@@ -24,8 +24,56 @@ class Settings(BaseSettings):
 
     static_folder: str = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static"))
     template_folder: str = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "templates"))
+    # directory shared by workers and restarts for compiled templates, None disables the bytecode cache
+    template_bytecode_cache: str | None = Field(default=None)
+    # compile all templates in initialize instead of on their first render
+    template_precompile: bool = Field(default=True)
+    # characters buffered between flushes of streamed templates, the head is always flushed on its own
+    template_stream_buffer_size: int = Field(default=16 * 1024)
+
+    compression_minimum_size: int = Field(default=500)
+    # None compresses the text media types listed in utils.compression_middleware.DEFAULT_MEDIA_TYPES
+    compression_media_types: list[str] | None = Field(default=None)
+    compression_gzip_level: int = Field(default=6)
+    compression_brotli_quality: int = Field(default=4)
+    compression_zstd_level: int = Field(default=3)
 
     redis_url: AnyUrl = Field(default="redis://localhost:6382/0")
+    redis_max_connections: int = Field(default=50)
+    redis_pool_timeout: float | None = Field(default=5.0)
+    redis_socket_timeout: float | None = Field(default=5.0)
+    redis_socket_connect_timeout: float | None = Field(default=2.0)
+    redis_health_check_interval: int = Field(default=30)
+    redis_warmup_connections: int = Field(default=5)
+
+    session_backend: Literal["redis", "memory"] = Field(default="redis")
+    session_key_prefix: str = Field(default="session:")
+    session_index_prefix: str = Field(default="user_sessions:")
+    session_sliding_expiry: bool = Field(default=True)
+    session_touch_interval: int = Field(default=5 * 60)
+    session_lazy: bool = Field(default=True)
+    session_exclude_paths: list[str] = Field(default=["/static"])
+    session_cookie_max_bytes: int = Field(default=0)
+    session_cookie_compress: bool = Field(default=True)
+    session_miss_cache_size: int = Field(default=10_000)
+    session_miss_cache_ttl: int = Field(default=60)
+    session_cache_enabled: bool = Field(default=False)
+    session_cache_size: int = Field(default=10_000)
+    # seconds between pings of the invalidation connections, a missing reply within the next interval resets the cache
+    session_cache_ping_interval: float = Field(default=5.0)
+
+    user_cache_size: int = Field(default=10_000)
+    user_freshness_seconds: int = Field(default=5 * 60)
+    login_events_batch_size: int = Field(default=500)
+    login_events_flush_interval: float = Field(default=2.0)
+    export_batch_size: int = Field(default=1000)
+    # bearer token for the /internal ops endpoints, which are closed while unset
+    internal_token: str | None = Field(default=None)
+    page_cache_prefix: str = Field(default="page:")
+    page_cache_local_ttl: float = Field(default=2.0)
+    page_cache_local_size: int = Field(default=1000)
+    page_cache_stale_ttl: int = Field(default=30)
+    page_cache_lock_timeout: float = Field(default=5.0)
 
     brand_color: str = Field(default="#7289DA")
 
@@ -46,11 +94,35 @@ class DatabaseSettings(BaseSettings):
 
     echo: bool = False
 
+    pool_size: int = 20
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = -1
+    # ping connections on checkout only if they were idle longer than this many seconds, None disables pinging
+    pool_pre_ping_idle: float | None = 30.0
+    # connections opened per engine at startup, capped at pool_size
+    pool_warmup_connections: int = 5
+
+    # optional streaming replica for ReadOnlySession, falls back to the primary while unreachable or lagging
+    replica_host: str | None = None
+    replica_port: int | None = None
+    replica_max_lag: float = 5.0
+    replica_check_interval: float = 5.0
+    replica_probe_timeout: float = 2.0
+
     @property
     def url(self) -> str:
         password = quote_plus(self.password)
         return f"{self.driver}://{self.username}:{password}@{self.host}:{self.port}/{self.name}"
 
+    @property
+    def replica_url(self) -> str | None:
+        if not self.replica_host:
+            return None
+        password = quote_plus(self.password)
+        port = self.replica_port or self.port
+        return f"{self.driver}://{self.username}:{password}@{self.replica_host}:{port}/{self.name}"
+
     @property
     def sync_url(self) -> str:
         password = quote_plus(self.password)
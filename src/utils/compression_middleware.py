@@ -0,0 +1,171 @@
+import zlib
+from collections.abc import Callable, Iterable
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.static_files import accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+__all__ = ["CompressionMiddleware"]
+
+DEFAULT_MEDIA_TYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/csv",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "image/svg+xml",
+)
+
+
+class _Compressor:
+    """
+    Incremental compressor: `compress` returns everything the client can decode so far, `finish` the rest.
+    """
+
+    def __init__(self, compress: Callable[[bytes], bytes], flush: Callable[[], bytes], finish: Callable[[], bytes]):
+        self._compress = compress
+        self._flush = flush
+        self._finish = finish
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data) + self._flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compress(data) + self._finish()
+
+
+def _gzip(level: int) -> _Compressor:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return _Compressor(compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush)
+
+
+def _brotli(quality: int) -> _Compressor:
+    compressor = brotli.Compressor(quality=quality)
+    return _Compressor(compressor.process, compressor.flush, compressor.finish)
+
+
+def _zstd(level: int) -> _Compressor:
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return _Compressor(
+        compressor.compress,
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH),
+    )
+
+
+def _weaken_etag(headers: MutableHeaders) -> None:
+    # Starlette's FileResponse sends its ETag unquoted, a weak validator needs the quotes
+    if (etag := headers.get("ETag")) and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}" if etag.startswith('"') else f'W/"{etag}"'
+
+
+class CompressionMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    Pure ASGI response compression with br and zstd when their packages are installed, gzip otherwise.
+
+    Every body message is compressed and flushed on its own, so streamed responses keep streaming. Responses are left
+    alone if they are smaller than `minimum_size` in a single message, already have a Content-Encoding (e.g.
+    precompressed static files), are not one of `media_types`, or ask for `no-transform`. Compressed responses lose
+    Content-Length, get `Vary: Accept-Encoding`, and their strong ETag becomes weak as the bytes differ.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int = 500,
+        media_types: Iterable[str] = DEFAULT_MEDIA_TYPES,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        zstd_level: int = 3,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.media_types = tuple(media_types)
+        # Content-Encoding -> compressor factory, in order of preference
+        self.compressors: dict[str, Callable[[], _Compressor]] = {}
+        if brotli is not None:
+            self.compressors["br"] = lambda: _brotli(brotli_quality)
+        if zstandard is not None:
+            self.compressors["zstd"] = lambda: _zstd(zstd_level)
+        self.compressors["gzip"] = lambda: _gzip(gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":  # pragma: no cover
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = next((encoding for encoding in self.compressors if encoding in accepted), None)
+        start: Message | None = None
+        compressor: _Compressor | None = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if not self._compressible(message["status"], headers):
+                    await send(message)
+                    return
+                vary = headers.get("vary", "")
+                if "accept-encoding" not in vary.lower():
+                    MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+                if encoding is None:
+                    await send(message)
+                    return
+                if scope["method"] == "HEAD":
+                    # no body to compress, but the headers should match those of the GET
+                    _weaken_etag(MutableHeaders(scope=message))
+                    await send(message)
+                    return
+                # held back until the first body message shows whether compressing is worth it
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                # zero-copy file sends can't be compressed here
+                if compressor is None:
+                    await send(start)
+                    start = None
+                await send(message)
+                return
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                compressor = self.compressors[encoding]()
+                headers = MutableHeaders(scope=start)
+                headers["Content-Encoding"] = encoding
+                del headers["Content-Length"]
+                _weaken_etag(headers)
+                await send(start)
+            data = compressor.compress(body) if more_body else compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compressible(self, status: int, headers: Headers) -> bool:
+        if status < 200 or status in (204, 304) or "content-encoding" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", ""):
+            return False
+        media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        return media_type in self.media_types
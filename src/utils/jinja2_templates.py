@@ -1,4 +1,6 @@
+import hashlib
 import os
+from collections.abc import AsyncIterator, Iterable
 from pathlib import Path
 from typing import Annotated
 
@@ -7,44 +9,95 @@ import orjson
 from fastapi import Depends
 from loguru import logger
 from starlette.requests import Request
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, Response, StreamingResponse
 from starlette.templating import Jinja2Templates, pass_context
 
 from settings import Settings, get_settings
 
-__all__ = ["JinjaTemplates", "Template"]
+__all__ = ["AssetManifest", "JinjaTemplates", "Template"]
 
 _settings = get_settings(Settings)
 
 
-def get_manifest(folder: str = "frontend") -> dict[str, str]:
+class AssetManifest:
     """
-    Retrieves the manifest file for the specified folder.
+    Maps asset names to their built, hashed paths from `<static_folder>/<folder>/assets-manifest.json`.
 
-    :param folder: The folder in which the manifest file is located. Defaults to "frontend".
-    :return: A dictionary containing the contents of the manifest file.
+    The manifest is read once by `load`. With `auto_reload` every lookup checks the file's mtime and rereads it after a
+    frontend rebuild.
     """
-    manifest_file_path = Path(_settings.static_folder) / folder / "assets-manifest.json"
 
-    try:
-        manifest_data = manifest_file_path.read_text(encoding="utf-8")
-        return orjson.loads(manifest_data)  # pylint: disable=maybe-no-member
-    except orjson.JSONDecodeError as exc:  # pylint: disable=maybe-no-member
-        logger.error("Could not parse frontend manifest {}", exc)
-        return {}
+    class ManifestError(Exception):
+        pass
 
+    def __init__(self, folder: str = "frontend", *, auto_reload: bool = False):
+        self.folder = folder
+        self.auto_reload = auto_reload
+        self.path = Path(_settings.static_folder) / folder / "assets-manifest.json"
+        self._assets: dict[str, str] = {}
+        self._hashed_paths: frozenset[str] = frozenset()
+        self._mtime: float | None = None
+        self.digest = ""
 
-@pass_context  # context is required otherwise jinja2 caches the result in bytecode for constants
-def debug_asset_filter(_, path):
-    path = "frontend" + "/" + get_manifest("frontend").get(path)
-    logger.debug("asset: {}", path)
-    return path
+    def load(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime
+            data = self.path.read_bytes()
+            manifest = orjson.loads(data)  # pylint: disable=maybe-no-member
+        except (OSError, orjson.JSONDecodeError) as exc:  # pylint: disable=maybe-no-member
+            raise self.ManifestError(f"Could not read asset manifest {self.path}: {exc}") from exc
+        self._assets = {name: f"{self.folder}/{path}" for name, path in manifest.items()}
+        self._hashed_paths = frozenset(self._assets.values())
+        self._mtime = mtime
+        self.digest = hashlib.sha1(data).hexdigest()[:12]
 
+    def check(self, names: Iterable[str]) -> None:
+        if missing := sorted(set(names) - self._assets.keys()):
+            raise self.ManifestError(f"Assets missing from {self.path}: {', '.join(missing)}")
 
-def asset_filter(path):
-    path = "frontend" + "/" + get_manifest("frontend").get(path)
-    logger.debug("asset: {}", path)
-    return path
+    def _reload_if_changed(self) -> None:
+        try:
+            if self.path.stat().st_mtime != self._mtime:
+                self.load()
+        except (OSError, self.ManifestError) as exc:
+            logger.error("Keeping previous asset manifest: {}", exc)
+
+    def is_hashed(self, path: str) -> bool:
+        """
+        Whether `path`, relative to the static folder, is a built asset with a content hash in its name.
+        """
+        if self.auto_reload:
+            self._reload_if_changed()
+        return path in self._hashed_paths
+
+    def __call__(self, name: str) -> str:
+        if self.auto_reload:
+            self._reload_if_changed()
+        try:
+            return self._assets[name]
+        except KeyError:
+            raise self.ManifestError(f"Asset {name!r} is missing from {self.path}") from None
+
+
+def _template_assets(env: jinja2.Environment) -> set[str]:
+    """
+    Collects the constant arguments of the `asset` filter in all templates, e.g. `"main.js"|asset`.
+    """
+    names = set()
+    for template_name in env.list_templates(filter_func=lambda name: name.endswith(".html")):
+        source, *_ = env.loader.get_source(env, template_name)
+        for node in env.parse(source).find_all(jinja2.nodes.Filter):
+            if node.name == "asset" and isinstance(node.node, jinja2.nodes.Const):
+                names.add(node.node.value)
+    return names
+
+
+def _templates_digest(env: jinja2.Environment) -> str:
+    digest = hashlib.sha1()
+    for template_name in env.list_templates():
+        digest.update(template_name.encode())
+        digest.update(env.loader.get_source(env, template_name)[0].encode())
+    return digest.hexdigest()
 
 
 class JinjaTemplates:
@@ -53,14 +106,72 @@ class JinjaTemplates:
             self.message = message
 
     templates = None
+    manifest: AssetManifest | None = None
+    # changes with the deployed code, the templates and the asset manifest, part of every declared cache key
+    version = ""
 
     def __init__(self, request: Request):
         self.request = request
 
-    async def __call__(self, template_file, status_code=200, **kwargs):
+    async def __call__(
+        self,
+        template_file,
+        status_code=200,
+        *,
+        etag: bool = False,
+        cache_key: str | None = None,
+        stream: bool = False,
+        **kwargs,
+    ):
+        """
+        Renders `template_file` into an `HTMLResponse`.
+
+        `etag=True` adds a strong ETag hashed from the rendered page. A `cache_key` declares everything the page
+        depends on besides the template, the current user and the host. It yields a weak ETag known before rendering,
+        so a matching `If-None-Match` is answered with 304 without rendering at all. Outside of debug mode only, as
+        templates are reloaded there.
+
+        `stream=True` returns a `StreamingResponse` instead, see `stream_template`. Headers, including the session
+        cookie, are sent before rendering starts, so the template must not change the session. Streamed pages only
+        get the declared ETag.
+        """
+        tag = None
+        if cache_key is not None and not _settings.debug:
+            user = self.request.scope.get("user")
+            key = "\0".join((self.version, template_file, str(getattr(user, "id", "")), str(self.request.base_url), cache_key))
+            tag = f'W/"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}"'
+            if self._not_modified(tag):
+                return Response(status_code=304, headers=self._etag_headers(tag))
         context = {"request": self.request}
         context.update(kwargs)
-        return HTMLResponse(await self.render_template(template_file, **context), status_code=status_code)
+        if stream:
+            headers = self._etag_headers(tag) if tag and status_code == 200 else None
+            return StreamingResponse(
+                self.stream_template(template_file, **context), status_code=status_code, media_type="text/html", headers=headers
+            )
+        content = (await self.render_template(template_file, **context)).encode()
+        if tag is None and (etag or cache_key is not None):
+            tag = f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+            if self._not_modified(tag):
+                return Response(status_code=304, headers=self._etag_headers(tag))
+        headers = self._etag_headers(tag) if tag and status_code == 200 else None
+        return HTMLResponse(content, status_code=status_code, headers=headers)
+
+    def _not_modified(self, tag: str) -> bool:
+        if self.request.method not in ("GET", "HEAD"):
+            return False
+        if_none_match = self.request.headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # If-None-Match uses the weak comparison
+        return tag.removeprefix("W/") in (value.strip().removeprefix("W/") for value in if_none_match.split(","))
+
+    @staticmethod
+    def _etag_headers(tag: str) -> dict[str, str]:
+        # pages are per user, browsers may keep them but have to revalidate
+        return {"ETag": tag, "Cache-Control": "private, no-cache", "Vary": "Cookie"}
 
     @classmethod
     async def render_template(cls, template, **kwargs):
@@ -69,6 +180,38 @@ class JinjaTemplates:
         template = cls.templates.get_template(template)
         return await template.render_async(**kwargs)
 
+    @classmethod
+    async def stream_template(cls, template, **kwargs) -> AsyncIterator[bytes]:
+        """
+        Renders with `generate_async` and yields the page up to `</head>` as soon as it is rendered, so the browser can
+        fetch styles and scripts while the body is still rendering. The body follows in chunks of about
+        `template_stream_buffer_size` characters.
+        """
+        if not cls.templates:
+            raise cls.JinjaException("You must call initialize() before rendering templates.")
+        template = cls.templates.get_template(template)
+        buffer, size, head_sent = [], 0, False
+        async for chunk in template.generate_async(**kwargs):
+            buffer.append(chunk)
+            size += len(chunk)
+            if (not head_sent and "</head>" in chunk) or size >= _settings.template_stream_buffer_size:
+                head_sent = head_sent or "</head>" in chunk
+                yield "".join(buffer).encode()
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer).encode()
+
+    @classmethod
+    def asset_manifest(cls) -> AssetManifest:
+        """
+        The manifest shared by the `asset` filter and `AssetStaticFiles`, loaded on first use.
+        """
+        if cls.manifest is None:
+            manifest = AssetManifest("frontend", auto_reload=_settings.debug)
+            manifest.load()
+            cls.manifest = manifest
+        return cls.manifest
+
     @classmethod
     def initialize(
         cls,
@@ -84,16 +227,42 @@ class JinjaTemplates:
             msg = f"The specified template folder must be a folder, it's not: {_settings.template_folder}"
             raise cls.JinjaException(msg)
 
+        manifest = cls.asset_manifest()
+
+        if _settings.template_bytecode_cache:
+            os.makedirs(_settings.template_bytecode_cache, exist_ok=True)
+            # asset paths are constant folded into the bytecode in production, a new manifest needs new cache files
+            pattern = f"__jinja2_{manifest.digest}_%s.cache"
+            env_options.setdefault("bytecode_cache", jinja2.FileSystemBytecodeCache(_settings.template_bytecode_cache, pattern))
         cls.templates = Jinja2Templates(directory=_settings.template_folder, enable_async=enable_async, **env_options)
         cls.templates.env.auto_reload = _settings.debug
         cls.templates.env.globals["settings"] = _settings.model_dump(exclude={"secret_key"})
 
+        # fails startup if the manifest lacks an asset referenced by a template
+        manifest.check(_template_assets(cls.templates.env))
+        cls.version = f"{_settings.git_version}:{manifest.digest}:{_templates_digest(cls.templates.env)}"
         if _settings.debug:
-            cls.templates.env.filters["asset"] = debug_asset_filter
+            # context is required otherwise jinja2 caches the result in bytecode for constants
+            cls.templates.env.filters["asset"] = pass_context(lambda _, name: manifest(name))
         else:
-            cls.templates.env.filters["asset"] = asset_filter
+            cls.templates.env.filters["asset"] = manifest
+
+        if _settings.template_precompile:
+            cls.precompile()
 
         return cls.templates.env
 
+    @classmethod
+    def precompile(cls) -> int:
+        """
+        Loads every template into the environment's cache, and into the bytecode cache if configured, so no request
+        pays for compiling one. Returns the number of templates.
+        """
+        names = cls.templates.env.list_templates(filter_func=lambda name: name.endswith(".html"))
+        for name in names:
+            cls.templates.env.get_template(name)
+        logger.info("Precompiled {} templates", len(names))
+        return len(names)
+
 
 Template = Annotated[JinjaTemplates, Depends(JinjaTemplates)]
@@ -0,0 +1,239 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+import orjson
+from loguru import logger
+from redis.exceptions import RedisError
+from starlette.requests import Request
+from starlette.responses import Response
+
+from db.redis import get_redis_connection
+from settings import Settings, get_settings
+
+__all__ = ["PageCache", "cached_page", "page_cache"]
+
+_settings = get_settings(Settings)
+
+# Deletes every page listed in the tag set KEYS[1] together with the set, atomically on the server, and returns the
+# deleted page keys.
+_INVALIDATE_SCRIPT = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+for _, key in ipairs(keys) do
+    redis.call('DEL', key)
+end
+redis.call('DEL', KEYS[1])
+return keys
+"""
+
+# headers that belong to one response only and are never stored
+_UNCACHED_HEADERS = {"content-length", "set-cookie", "date", "server"}
+
+
+class PageCache:
+    """
+    Shared cache of rendered responses for anonymous visitors, see `cached_page`.
+
+    Entries live in redis for `ttl + stale_ttl` seconds and are fresh for `ttl`. Each worker keeps them for up to
+    `local_ttl` seconds in a small LRU in front of redis. Once an entry is stale, one worker takes a lock and renders
+    the page again while the others keep serving the stale copy. On a complete miss the others wait up to
+    `lock_timeout` for the winner instead of all rendering at once. Redis errors fall back to rendering uncached.
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str = "page:",
+        local_ttl: float = 2.0,
+        local_size: int = 1000,
+        stale_ttl: int = 30,
+        lock_timeout: float = 5.0,
+    ):
+        self.prefix = prefix
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self._local: OrderedDict[str, tuple[dict[str, Any], float]] = OrderedDict()
+        self.counters = {"local_hits": 0, "hits": 0, "stale_hits": 0, "misses": 0, "bypassed": 0, "errors": 0}
+
+    def key(self, request: Request, vary: Iterable[str]) -> str:
+        parts = [str(request.base_url), request.url.path, request.url.query]
+        parts.extend(f"{header}={request.headers.get(header, '')}" for header in vary)
+        return self.prefix + hashlib.sha1("\0".join(parts).encode()).hexdigest()
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    def _get_local(self, key: str) -> dict[str, Any] | None:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return entry[0]
+
+    def _set_local(self, key: str, entry: dict[str, Any]) -> None:
+        self._local[key] = (entry, min(time.monotonic() + self.local_ttl, entry["fresh_until"] - time.time() + time.monotonic()))
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _response(entry: dict[str, Any], state: str) -> Response:
+        response = Response(entry["body"], status_code=entry["status"], headers=entry["headers"])
+        response.headers["X-Page-Cache"] = state
+        return response
+
+    @staticmethod
+    def _entry(response: Response, ttl: int) -> dict[str, Any] | None:
+        if response.status_code != 200 or not hasattr(response, "body") or "set-cookie" in response.headers:
+            return None
+        try:
+            body = response.body.decode()
+        except UnicodeDecodeError:
+            return None
+        headers = {name: value for name, value in response.headers.items() if name not in _UNCACHED_HEADERS}
+        return {"status": response.status_code, "headers": headers, "body": body, "fresh_until": time.time() + ttl}
+
+    async def serve(
+        self, request: Request, render: Callable[[], Awaitable[Any]], *, ttl: int, tags: Iterable[str] = (), vary: Iterable[str] = ()
+    ) -> Any:
+        if request.scope.get("user") or request.method not in ("GET", "HEAD"):
+            self.counters["bypassed"] += 1
+            return await render()
+        key = self.key(request, vary)
+        if (entry := self._get_local(key)) is not None:
+            self.counters["local_hits"] += 1
+            return self._response(entry, "hit")
+        try:
+            redis = await get_redis_connection()
+            entry = await self._get(redis, key)
+            if entry is not None and entry["fresh_until"] > time.time():
+                self.counters["hits"] += 1
+                self._set_local(key, entry)
+                return self._response(entry, "hit")
+            locked = await redis.set(f"{key}:lock", 1, nx=True, px=int(self.lock_timeout * 1000))
+            if not locked:
+                if entry is not None:
+                    self.counters["stale_hits"] += 1
+                    return self._response(entry, "stale")
+                if (entry := await self._wait(redis, key)) is not None:
+                    self.counters["hits"] += 1
+                    self._set_local(key, entry)
+                    return self._response(entry, "hit")
+        except RedisError as exc:
+            self.counters["errors"] += 1
+            logger.warning("Page cache unavailable: {}", exc)
+            return await render()
+        self.counters["misses"] += 1
+        try:
+            response = await render()
+            try:
+                if isinstance(response, Response) and (entry := self._entry(response, ttl)) is not None:
+                    await self._store(redis, key, entry, ttl, tags)
+                    self._set_local(key, entry)
+                    response.headers["X-Page-Cache"] = "miss"
+            except RedisError as exc:
+                self.counters["errors"] += 1
+                logger.warning("Could not store page in cache: {}", exc)
+        finally:
+            # also after a failed or uncacheable render, so waiting workers render themselves right away
+            if locked:
+                try:
+                    await redis.delete(f"{key}:lock")
+                except RedisError as exc:
+                    logger.warning("Could not release page cache lock: {}", exc)
+        return response
+
+    @staticmethod
+    async def _get(redis, key: str) -> dict[str, Any] | None:
+        value = await redis.get(key)
+        return orjson.loads(value) if value else None
+
+    async def _wait(self, redis, key: str) -> dict[str, Any] | None:
+        """
+        Waits for the lock holder to store the page. Returns None once the lock is gone without a page, e.g. after a
+        failed or uncacheable render, or after `lock_timeout`.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            async with redis.pipeline(transaction=False) as pipe:
+                value, locked = await pipe.get(key).exists(f"{key}:lock").execute()
+            if value:
+                return orjson.loads(value)
+            if not locked:
+                return None
+        return None
+
+    async def _store(self, redis, key: str, entry: dict[str, Any], ttl: int, tags: Iterable[str]) -> None:
+        expire = ttl + self.stale_ttl
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, orjson.dumps(entry), ex=expire)
+            for tag in tags:
+                tag_key = self._tag_key(tag)
+                pipe.sadd(tag_key, key)
+                # keep the tag set at least as long as its longest living page
+                pipe.expire(tag_key, expire, gt=True)
+                pipe.expire(tag_key, expire, nx=True)
+            await pipe.execute()
+
+    async def invalidate(self, tag: str) -> int:
+        """
+        Drops all pages stored with `tag`, returns how many. Local copies in other workers expire within `local_ttl`.
+        """
+        redis = await get_redis_connection()
+        keys = await redis.eval(_INVALIDATE_SCRIPT, 1, self._tag_key(tag))
+        for key in keys:
+            self._local.pop(key, None)
+        return len(keys)
+
+    def stats(self) -> dict[str, int]:
+        return {**self.counters, "local_size": len(self._local)}
+
+
+page_cache = PageCache(
+    prefix=_settings.page_cache_prefix,
+    local_ttl=_settings.page_cache_local_ttl,
+    local_size=_settings.page_cache_local_size,
+    stale_ttl=_settings.page_cache_stale_ttl,
+    lock_timeout=_settings.page_cache_lock_timeout,
+)
+
+
+def cached_page(*, ttl: int, tags: Iterable[str] = (), vary: Iterable[str] = ()):
+    """
+    Caches the response of a route in `page_cache` for anonymous GET requests, keyed by host, path, query and the
+    `vary` request headers. The route must return a `Response`, e.g. from `Template`.
+
+        @router.get("/")
+        @cached_page(ttl=60, tags=("login",))
+        async def login(template: Template):
+            ...
+    """
+    tags, vary = tuple(tags), tuple(header.lower() for header in vary)
+
+    def decorator(endpoint):
+        signature = inspect.signature(endpoint)
+        request_param = next((name for name, param in signature.parameters.items() if param.annotation is Request), None)
+        parameters = list(signature.parameters.values())
+        if request_param is None:
+            parameters.append(inspect.Parameter("_page_cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request = kwargs[request_param] if request_param else kwargs.pop("_page_cache_request")
+            return await page_cache.serve(request, lambda: endpoint(*args, **kwargs), ttl=ttl, tags=tags, vary=vary)
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
+        return wrapper
+
+    return decorator
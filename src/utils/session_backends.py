@@ -0,0 +1,277 @@
+import time
+import typing
+from collections.abc import Collection
+
+import orjson
+from loguru import logger
+from redis.exceptions import ResponseError
+
+from db.dependencies import Redis
+from utils.session_cache import MissCache, SessionCache
+
+__all__ = ["MemorySessionBackend", "RedisSessionBackend", "SessionBackend"]
+
+# Changes and extends the session hash KEYS[1] only while it still exists, so a write racing a delete never brings a
+# logged out or revoked session back. Indexes the session in KEYS[2] and drops it from KEYS[3] unless they are ''.
+# ARGV: duration, session id, now, number of updated fields, the updated field value pairs, the deleted fields.
+_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local duration, session_id, now, updated = tonumber(ARGV[1]), ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+local deleted_from = 5 + updated * 2
+if updated > 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 5, deleted_from - 1))
+end
+if #ARGV >= deleted_from then
+    redis.call('HDEL', KEYS[1], unpack(ARGV, deleted_from))
+end
+redis.call('EXPIRE', KEYS[1], duration)
+if KEYS[3] ~= '' then
+    redis.call('ZREM', KEYS[3], session_id)
+end
+if KEYS[2] ~= '' then
+    redis.call('ZADD', KEYS[2], now + duration, session_id)
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    redis.call('EXPIRE', KEYS[2], duration)
+end
+return 1
+"""
+
+
+class SessionBackend(typing.Protocol):
+    """
+    Storage used by `SessionMiddleware`.
+
+    `save` receives the full session data plus the keys changed since loading. `updated=None` asks for a full
+    rewrite. `user_id` and `previous_user_id` let backends keep a per-user index of sessions.
+    """
+
+    async def load(self, session_id: str) -> tuple[dict, int | None] | None:
+        """Returns the session data and its remaining ttl in seconds, or None if there is no such session."""
+
+    async def save(
+        self,
+        session_id: str,
+        data: dict,
+        *,
+        duration: int,
+        updated: Collection[str] | None = None,
+        deleted: Collection[str] = (),
+        user_id: str | None = None,
+        previous_user_id: str | None = None,
+    ) -> None:
+        ...
+
+    async def touch(self, session_id: str, *, duration: int, user_id: str | None = None) -> None:
+        ...
+
+    async def delete(self, session_id: str, *, user_id: str | None = None) -> None:
+        ...
+
+    def stats(self) -> dict[str, typing.Any]:
+        ...
+
+
+class RedisSessionBackend:
+    """
+    Stores each session as a redis hash with one orjson encoded value per key, so only changed fields are written.
+    Sessions holding a user are indexed in a sorted set per user, scored by expiry.
+    """
+
+    def __init__(self, *, key_prefix: str = "", index_prefix: str = "user_sessions:", miss_cache: MissCache | None = None):
+        self.key_prefix = key_prefix
+        self.index_prefix = index_prefix
+        self.miss_cache = miss_cache
+        self.cache: SessionCache | None = None
+        self._redis: Redis | None = None
+
+    async def initialize(self, redis: Redis, *, cache: SessionCache | None = None):
+        self._redis = redis
+        self.cache = cache
+
+    @property
+    def redis(self) -> Redis:
+        if not self._redis:
+            raise RuntimeError("Redis is not initialized")
+        return self._redis
+
+    async def load(self, session_id: str) -> tuple[dict, int | None] | None:
+        key = self.key_prefix + session_id
+        if self.miss_cache is not None and key in self.miss_cache:
+            return None
+        if self.cache and (cached := self.cache.get(key)):
+            return cached
+        token = self.cache.begin(key) if self.cache else None
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                data, ttl = await pipe.hgetall(key).ttl(key).execute(raise_on_error=False)
+            if isinstance(data, ResponseError):
+                logger.warning("Session [{}] is not stored as a hash, ignoring it: {}", session_id, data)
+                return None
+            if not data:
+                if self.miss_cache is not None:
+                    self.miss_cache.add(key)
+                return None
+            data = {field: orjson.loads(value) for field, value in data.items()}
+            if token:
+                self.cache.set(key, data, ttl, token)
+            return data, ttl
+        finally:
+            # misses and errors leave nothing to set, don't keep their token around
+            if token:
+                self.cache.cancel(key, token)
+
+    async def save(
+        self,
+        session_id: str,
+        data: dict,
+        *,
+        duration: int,
+        updated: Collection[str] | None = None,
+        deleted: Collection[str] = (),
+        user_id: str | None = None,
+        previous_user_id: str | None = None,
+    ) -> None:
+        key = self.key_prefix + session_id
+        try:
+            if updated is not None:
+                # partial updates only apply to a session that still exists
+                mapping = {item: orjson.dumps(data[item]) for item in updated}
+                await self._update(session_id, duration, mapping, deleted, user_id=user_id, previous_user_id=previous_user_id)
+                return
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                if data:
+                    pipe.hset(key, mapping={item: orjson.dumps(value) for item, value in data.items()})
+                pipe.expire(key, duration)
+                if previous_user_id and previous_user_id != user_id:
+                    pipe.zrem(self.index_prefix + previous_user_id, session_id)
+                self._index_session(pipe, session_id, duration, user_id)
+                await pipe.execute()
+        finally:
+            self._invalidate_local(key)
+
+    async def touch(self, session_id: str, *, duration: int, user_id: str | None = None) -> None:
+        try:
+            await self._update(session_id, duration, {}, (), user_id=user_id)
+        finally:
+            self._invalidate_local(self.key_prefix + session_id)
+
+    async def _update(
+        self,
+        session_id: str,
+        duration: int,
+        mapping: dict[str, bytes],
+        deleted: Collection[str],
+        *,
+        user_id: str | None,
+        previous_user_id: str | None = None,
+    ) -> bool:
+        keys = [
+            self.key_prefix + session_id,
+            self.index_prefix + user_id if user_id else "",
+            self.index_prefix + previous_user_id if previous_user_id and previous_user_id != user_id else "",
+        ]
+        args = [duration, session_id, time.time(), len(mapping)]
+        for item, value in mapping.items():
+            args.extend((item, value))
+        args.extend(deleted)
+        return bool(await self.redis.eval(_UPDATE_SCRIPT, len(keys), *keys, *args))
+
+    async def delete(self, session_id: str, *, user_id: str | None = None) -> None:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(self.key_prefix + session_id)
+                if user_id:
+                    pipe.zrem(self.index_prefix + user_id, session_id)
+                await pipe.execute()
+        finally:
+            self._invalidate_local(self.key_prefix + session_id)
+
+    def _invalidate_local(self, key: str) -> None:
+        # don't wait for redis to report our own write, also voids a load of the old value still in flight
+        if self.cache:
+            self.cache.invalidate(key)
+
+    def _index_session(self, pipe, session_id: str, duration: int, user_id: str | None) -> None:
+        if user_id:
+            index = self.index_prefix + user_id
+            now = time.time()
+            pipe.zadd(index, {session_id: now + duration})
+            pipe.zremrangebyscore(index, "-inf", now)
+            pipe.expire(index, duration)
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {
+            "cache": self.cache.stats() if self.cache else {},
+            "miss_cache_size": len(self.miss_cache) if self.miss_cache is not None else 0,
+        }
+
+
+class MemorySessionBackend:
+    """
+    In-process, ttl aware session storage for tests, benchmarks and single node deployments without redis.
+    Values are orjson encoded per key like in redis, so both backends hand out the same types. Sessions are not
+    shared between workers and are lost on restart.
+    """
+
+    def __init__(self, *, sweep_every: int = 1000):
+        self._sessions: dict[str, tuple[dict[str, bytes], float]] = {}
+        self._sweep_every = sweep_every
+        self._writes = 0
+
+    async def initialize(self, *_, **__):
+        pass
+
+    def _get(self, session_id: str) -> tuple[dict[str, bytes], float] | None:
+        entry = self._sessions.get(session_id)
+        if entry is not None and entry[1] <= time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return entry
+
+    def _sweep(self) -> None:
+        self._writes += 1
+        if self._writes % self._sweep_every == 0:
+            now = time.monotonic()
+            for session_id in [session_id for session_id, (_, expires_at) in self._sessions.items() if expires_at <= now]:
+                del self._sessions[session_id]
+
+    async def load(self, session_id: str) -> tuple[dict, int | None] | None:
+        if (entry := self._get(session_id)) is None:
+            return None
+        data, expires_at = entry
+        return {field: orjson.loads(value) for field, value in data.items()}, int(expires_at - time.monotonic())
+
+    async def save(
+        self,
+        session_id: str,
+        data: dict,
+        *,
+        duration: int,
+        updated: Collection[str] | None = None,
+        deleted: Collection[str] = (),
+        user_id: str | None = None,
+        previous_user_id: str | None = None,
+    ) -> None:
+        entry = self._get(session_id)
+        if updated is None or entry is None:
+            stored = {item: orjson.dumps(value) for item, value in data.items()}
+        else:
+            stored = entry[0]
+            stored.update({item: orjson.dumps(data[item]) for item in updated})
+            for item in deleted:
+                stored.pop(item, None)
+        self._sessions[session_id] = (stored, time.monotonic() + duration)
+        self._sweep()
+
+    async def touch(self, session_id: str, *, duration: int, user_id: str | None = None) -> None:
+        if (entry := self._get(session_id)) is not None:
+            self._sessions[session_id] = (entry[0], time.monotonic() + duration)
+
+    async def delete(self, session_id: str, *, user_id: str | None = None) -> None:
+        self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict[str, typing.Any]:
+        return {"size": len(self._sessions)}
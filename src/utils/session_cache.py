@@ -0,0 +1,197 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import redis.asyncio as redis
+from loguru import logger
+
+__all__ = ["MissCache", "SessionCache"]
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class SessionCache:
+    """
+    Bounded per-worker LRU of decoded sessions.
+
+    Coherence is kept through redis client side caching: a dedicated connection enables broadcast tracking for the
+    session key prefix and redirects the invalidation messages to a second connection subscribed to
+    `__redis__:invalidate`. Every write, expiry or eviction of a session key in redis drops the local copy. Both
+    connections are pinged every `ping_interval` seconds. While either is down or doesn't answer the cache is flushed
+    and bypassed until tracking is set up again.
+    """
+
+    def __init__(self, maxsize: int = 10_000, *, ping_interval: float = 5.0):
+        self.maxsize = maxsize
+        self.ping_interval = ping_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, tuple[dict, float | None]] = OrderedDict()
+        self._pending: dict[str, object] = {}
+        self._active = False
+        self._task: asyncio.Task | None = None
+
+    def begin(self, key: str) -> object | None:
+        """
+        Marks a key as being fetched from redis. An invalidation arriving before `set` voids the returned token.
+        """
+        if not self._active:
+            return None
+        token = self._pending[key] = object()
+        return token
+
+    def get(self, key: str) -> tuple[dict, int | None] | None:
+        if not self._active:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        data, expires_at = entry
+        ttl = None
+        if expires_at is not None:
+            ttl = int(expires_at - time.monotonic())
+            if ttl <= 0:
+                del self._entries[key]
+                self.misses += 1
+                return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(data), ttl
+
+    def set(self, key: str, data: dict, ttl: int | None, token: object | None) -> None:
+        if token is None or self._pending.get(key) is not token:
+            return
+        del self._pending[key]
+        expires_at = time.monotonic() + ttl if ttl is not None and ttl >= 0 else None
+        self._entries[key] = (dict(data), expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def cancel(self, key: str, token: object | None) -> None:
+        """
+        Ends a fetch started with `begin` that didn't `set` anything, unless a newer fetch of the key took over.
+        """
+        if token is not None and self._pending.get(key) is token:
+            del self._pending[key]
+
+    def invalidate(self, key: str) -> None:
+        self._pending.pop(key, None)
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def flush(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._pending.clear()
+
+    def stats(self) -> dict[str, int | bool]:
+        return {
+            "active": self._active,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    async def start(self, url: str, prefix: str) -> None:
+        self._task = asyncio.create_task(self._listen(url, prefix))
+
+    async def stop(self) -> None:
+        self._active = False
+        self.flush()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self, url: str, prefix: str) -> None:
+        pool = redis.ConnectionPool.from_url(url, decode_responses=True, socket_keepalive=True)
+        while True:
+            subscriber = pool.make_connection()
+            tracker = pool.make_connection()
+            try:
+                await subscriber.connect()
+                await tracker.connect()
+                await subscriber.send_command("CLIENT", "ID")
+                subscriber_id = await subscriber.read_response()
+                await subscriber.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+                await subscriber.read_response()
+                await tracker.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", subscriber_id, "BCAST", "PREFIX", prefix)
+                await tracker.read_response()
+                self._active = True
+                logger.info("Session cache tracking {}* via client {}", prefix, subscriber_id)
+                next_ping = time.monotonic()
+                awaiting_pong = False
+                while True:
+                    if time.monotonic() >= next_ping:
+                        if awaiting_pong:
+                            raise ConnectionError("No PING reply on the invalidation connection")
+                        await subscriber.send_command("PING")
+                        awaiting_pong = True
+                        await tracker.send_command("PING")
+                        if await tracker.read_response(timeout=self.ping_interval) != "PONG":
+                            raise ConnectionError("No PING reply on the tracking connection")
+                        next_ping = time.monotonic() + self.ping_interval
+                    # returns None once the timeout passes without a message
+                    message = await subscriber.read_response(timeout=max(next_ping - time.monotonic(), 0))
+                    if isinstance(message, list) and message and message[0] == "pong":
+                        awaiting_pong = False
+                        continue
+                    if not isinstance(message, list) or len(message) != 3 or message[0] != "message":
+                        continue
+                    if message[2] is None:
+                        # FLUSHALL / FLUSHDB
+                        self.flush()
+                        continue
+                    for key in message[2]:
+                        self.invalidate(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Session cache invalidation connection lost: {}", exc)
+            finally:
+                self._active = False
+                self.flush()
+                await subscriber.disconnect()
+                await tracker.disconnect()
+            await asyncio.sleep(1)
+
+
+class MissCache:
+    """
+    Bounded set of recently missed session keys, so repeated requests with a stale cookie don't hit redis.
+    Entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, float] = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self._entries.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False
+        return True
+
+    def add(self, key: str) -> None:
+        self._entries[key] = time.monotonic() + self.ttl
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
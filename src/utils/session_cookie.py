@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import hmac
+import uuid
+import zlib
+
+import orjson
+from itsdangerous import BadSignature, TimestampSigner
+from starlette.datastructures import Secret
+
+__all__ = ["CookieSessionCodec", "SessionIdSigner"]
+
+
+class CookieSessionCodec:
+    """
+    Encodes small sessions into an HMAC signed cookie value: `c.` + [`.` if zlib compressed] + urlsafe base64 of the
+    orjson payload, followed by the itsdangerous timestamp and signature.
+    """
+
+    PREFIX = "c."
+
+    def __init__(self, secret_key: str | Secret, *, max_age: int | None = None, compress: bool = True):
+        self.signer = TimestampSigner(str(secret_key), salt="session-cookie")
+        self.max_age = max_age
+        self.compress = compress
+
+    def dumps(self, data: dict) -> str:
+        payload = orjson.dumps(data)
+        compressed = False
+        if self.compress and len(payload) > 64:
+            deflated = zlib.compress(payload, 6)
+            if len(deflated) < len(payload):
+                payload, compressed = deflated, True
+        value = base64.urlsafe_b64encode(payload).rstrip(b"=")
+        if compressed:
+            value = b"." + value
+        return self.PREFIX + self.signer.sign(value).decode("ascii")
+
+    def loads(self, value: str) -> tuple[dict, int] | None:
+        """
+        Returns the session data and the age of the cookie in seconds, or None for invalid or expired values.
+        """
+        if not value.startswith(self.PREFIX):
+            return None
+        try:
+            payload, timestamp = self.signer.unsign(value[len(self.PREFIX) :], max_age=self.max_age, return_timestamp=True)
+        except BadSignature:
+            return None
+        compressed = payload.startswith(b".")
+        if compressed:
+            payload = payload[1:]
+        try:
+            payload = base64.urlsafe_b64decode(payload + b"=" * (-len(payload) % 4))
+            if compressed:
+                payload = zlib.decompress(payload)
+            data = orjson.loads(payload)
+        except (ValueError, zlib.error):
+            return None
+        if not isinstance(data, dict):
+            return None
+        age = int(self.signer.get_timestamp() - timestamp.timestamp())
+        return data, age
+
+
+class SessionIdSigner:
+    """
+    Issues session ids as `<uuid4 hex>.<truncated HMAC-SHA256>` so forged or garbage ids can be rejected without
+    asking redis.
+    """
+
+    def __init__(self, secret_key: str | Secret):
+        self._key = hashlib.sha256(b"session-id" + str(secret_key).encode("utf-8")).digest()
+
+    def _signature(self, value: str) -> str:
+        digest = hmac.new(self._key, value.encode("ascii"), hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def generate(self) -> str:
+        value = uuid.uuid4().hex
+        return f"{value}.{self._signature(value)}"
+
+    def verify(self, session_id: str) -> bool:
+        value, _, signature = session_id.partition(".")
+        if len(value) != 32 or not signature or not value.isascii():
+            return False
+        return hmac.compare_digest(signature, self._signature(value))
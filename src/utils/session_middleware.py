@@ -1,68 +1,252 @@
 import typing
-import uuid
+from typing import Annotated
 
 import orjson
+from fastapi import Depends
 from loguru import logger
 from starlette.datastructures import MutableHeaders, Secret
 from starlette.requests import HTTPConnection
 from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from db.dependencies import Redis
 from dependencies.user_social_auth_service import UserService
+from utils.session_backends import SessionBackend
+from utils.session_cookie import CookieSessionCodec, SessionIdSigner
 
 
 class SessionDict(dict):
+    """
+    Session data with change tracking on top of a `SessionBackend`.
+
+    Keys that are set or deleted are recorded, so `save` only hands those to the backend. Concurrent requests on the
+    same session therefore don't overwrite each other's unrelated keys.
+    """
+
     _value_changed = False
-    _redis: Redis = None
+    _cleared = False
+    _stored = False
+    _ttl: int | None = None
+    _indexed_user_id: str | None = None
+    counters: typing.ClassVar[dict[str, int]] = {"rejected": 0, "missed": 0, "loaded": 0}
+
+    def __init__(self, *args, backend: SessionBackend | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._backend = backend
+        self._updated_keys: set[str] = set()
+        self._deleted_keys: set[str] = set()
+
+    @property
+    def backend(self) -> SessionBackend:
+        if not self._backend:
+            raise RuntimeError("Session backend is not initialized")
+        return self._backend
 
     async def load(self, session_id: str):
-        if not self._redis:
-            raise RuntimeError("Redis is not initialized")
         if session_id:
-            data = await self._redis.get(session_id)
-            if data:
-                self.update(orjson.loads(data))
+            if (result := await self.backend.load(session_id)) is not None:
+                data, self._ttl = result
+                super().update(data)
+                self._stored = True
+                self._indexed_user_id = self._user_id()
+                self.counters["loaded"] += 1
                 return True
+            self.counters["missed"] += 1
         return False
 
-    def __setitem__(self, item, value):
+    def _user_id(self) -> str | None:
+        if user_data := dict.get(self, "user"):
+            return orjson.loads(user_data).get("id")
+        return None
+
+    def _mark_updated(self, item):
+        self._value_changed = True
+        self._updated_keys.add(item)
+        self._deleted_keys.discard(item)
+
+    def _mark_deleted(self, item):
         self._value_changed = True
+        self._deleted_keys.add(item)
+        self._updated_keys.discard(item)
+
+    def __setitem__(self, item, value):
+        self._mark_updated(item)
         return super().__setitem__(item, value)
 
     def __getitem__(self, item):
         return super().__getitem__(item)
 
     def __delitem__(self, key):
-        self._value_changed = True
-        return super().__delitem__(key)
+        result = super().__delitem__(key)
+        self._mark_deleted(key)
+        return result
 
     def get(self, item, default=None):
         return super().get(item, default)
 
     def pop(self, item, default=None):
-        self._value_changed = True
+        if item in self:
+            self._mark_deleted(item)
         return super().pop(item, default)
 
+    def popitem(self):
+        item, value = super().popitem()
+        self._mark_deleted(item)
+        return item, value
+
+    def setdefault(self, item, default=None):
+        if item not in self:
+            self._mark_updated(item)
+        return super().setdefault(item, default)
+
+    def update(self, *args, **kwargs):
+        other = dict(*args, **kwargs)
+        for item in other:
+            self._mark_updated(item)
+        return super().update(other)
+
     def clear(self):
         self._value_changed = True
+        self._cleared = True
+        self._updated_keys.clear()
+        self._deleted_keys.clear()
         return super().clear()
 
     async def save(self, session_id, *, duration=3600, force=False):
-        if not self._redis:
-            raise RuntimeError("Redis is not initialized")
-        if force or self._value_changed:
-            await self._redis.setex(session_id, duration, orjson.dumps(self))
-            return True
-        return False
+        if not (force or self._value_changed):
+            return False
+        full = force or self._cleared or not self._stored
+        user_id = self._user_id()
+        await self.backend.save(
+            session_id,
+            self,
+            duration=duration,
+            updated=None if full else self._updated_keys,
+            deleted=() if full else self._deleted_keys,
+            user_id=user_id,
+            previous_user_id=self._indexed_user_id,
+        )
+        self._value_changed = self._cleared = False
+        self._stored = True
+        self._indexed_user_id = user_id
+        self._updated_keys = set()
+        self._deleted_keys = set()
+        self._ttl = duration
+        return True
+
+    async def touch(self, session_id, *, duration=3600, interval=300):
+        """
+        Extends the expiry of an unchanged session, at most once per `interval` seconds.
+
+        The remaining ttl is returned by the backend together with the session in `load`, so deciding whether a
+        touch is due costs no extra round trip.
+        """
+        if self._ttl is not None and self._ttl >= 0 and duration - self._ttl < interval:
+            return False
+        await self.backend.touch(session_id, duration=duration, user_id=self._indexed_user_id)
+        self._ttl = duration
+        return True
 
     async def delete(self, session_id):
-        if not self._redis:
-            raise RuntimeError("Redis is not initialized")
-        await self._redis.delete(session_id)
+        await self.backend.delete(session_id, user_id=self._indexed_user_id)
+        self._indexed_user_id = None
+
+
+class LazySessionDict(SessionDict):
+    """
+    Session that is only fetched from the backend once `ensure_loaded` is awaited, normally through the `LoadedSession`
+    dependency. Using it before that raises a RuntimeError instead of silently looking empty.
+    """
+
+    def __init__(self, session_id: str | None, *, backend: SessionBackend | None = None):
+        super().__init__(backend=backend)
+        self._session_id = session_id
+        self._loaded = session_id is None
+
+    async def ensure_loaded(self) -> bool:
+        if not self._loaded:
+            self._loaded = True
+            if await self.load(self._session_id):
+                logger.info("Session loaded [{}] {}", self._session_id, self)
+            else:
+                logger.debug("Session not found {}", self._session_id)
+        return self._stored
+
+    def _check_loaded(self):
+        if not self._loaded:
+            raise RuntimeError("Session is not loaded, add the LoadedSession dependency to the route")
+
+    def __setitem__(self, item, value):
+        self._check_loaded()
+        return super().__setitem__(item, value)
+
+    def __getitem__(self, item):
+        self._check_loaded()
+        return super().__getitem__(item)
+
+    def __delitem__(self, key):
+        self._check_loaded()
+        return super().__delitem__(key)
+
+    def __contains__(self, item):
+        self._check_loaded()
+        return super().__contains__(item)
 
-    @classmethod
-    async def initialize(cls, redis: Redis):
-        cls._redis = redis
+    def __iter__(self):
+        self._check_loaded()
+        return super().__iter__()
+
+    def keys(self):
+        self._check_loaded()
+        return super().keys()
+
+    def values(self):
+        self._check_loaded()
+        return super().values()
+
+    def items(self):
+        self._check_loaded()
+        return super().items()
+
+    def get(self, item, default=None):
+        self._check_loaded()
+        return super().get(item, default)
+
+    def pop(self, item, default=None):
+        self._check_loaded()
+        return super().pop(item, default)
+
+    def popitem(self):
+        self._check_loaded()
+        return super().popitem()
+
+    def setdefault(self, item, default=None):
+        self._check_loaded()
+        return super().setdefault(item, default)
+
+    def update(self, *args, **kwargs):
+        self._check_loaded()
+        return super().update(*args, **kwargs)
+
+    def clear(self):
+        self._check_loaded()
+        return super().clear()
+
+
+async def _load_user(scope: Scope) -> None:
+    scope["user"] = await UserService.load_user_from_session(scope["session"])
+
+
+async def load_session(connection: HTTPConnection) -> SessionDict:
+    """
+    Dependency that makes sure `request.session` and `request.user` are available when the middleware runs lazily.
+    """
+    session = connection.scope["session"]
+    if isinstance(session, LazySessionDict) and not session._loaded:  # pylint: disable=protected-access
+        if await session.ensure_loaded():
+            await _load_user(connection.scope)
+    return session
+
+
+LoadedSession = Annotated[SessionDict, Depends(load_session)]
 
 
 class SessionMiddleware:
@@ -75,12 +259,30 @@ class SessionMiddleware:
         path: str = "/",
         same_site: typing.Literal["lax", "strict", "none"] = "lax",
         https_only: bool = False,
+        sliding_expiry: bool = True,
+        touch_interval: int = 5 * 60,
+        lazy: bool = False,
+        exclude_paths: typing.Sequence[str] = (),
+        cookie_max_bytes: int = 0,
+        cookie_compress: bool = True,
+        backend: SessionBackend | None = None,
     ):
+        if backend is None:
+            raise ValueError("SessionMiddleware needs a session backend")
         self.app = app
+        self.backend = backend
         self.secret_key = secret_key
         self.path = path
         self.session_cookie = session_cookie
         self.max_age = max_age
+        self.sliding_expiry = sliding_expiry
+        self.touch_interval = touch_interval
+        self.lazy = lazy
+        self.exclude_paths = tuple(path.rstrip("/") for path in exclude_paths)
+        # sessions whose signed cookie value fits into this budget are kept client side only, 0 disables it
+        self.cookie_max_bytes = cookie_max_bytes
+        self.cookie_codec = CookieSessionCodec(secret_key, max_age=max_age, compress=cookie_compress)
+        self.id_signer = SessionIdSigner(secret_key)
         self.security_flags = "httponly; samesite=" + same_site
         if https_only:  # Secure flag can be used with HTTPS only
             self.security_flags += "; secure"
@@ -90,35 +292,64 @@ class SessionMiddleware:
             await self.app(scope, receive, send)
             return
 
-        session_id = uuid.uuid4().hex
+        if self.exclude_paths and self._is_excluded(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = None
+        cookie_session = None
         connection = HTTPConnection(scope)
-        initial_session_was_empty = True
+
+        if self.session_cookie in connection.cookies and (cookie := connection.cookies[self.session_cookie]):
+            if cookie.startswith(CookieSessionCodec.PREFIX):
+                if (cookie_session := self.cookie_codec.loads(cookie)) is None:
+                    SessionDict.counters["rejected"] += 1
+            elif self.id_signer.verify(cookie):
+                session_id = cookie
+            else:
+                SessionDict.counters["rejected"] += 1
 
         scope["user"] = None
-        scope["session"] = SessionDict()
-        if self.session_cookie in connection.cookies and (cookie := connection.cookies[self.session_cookie].encode("utf-8")):
-            if len(cookie) == 32:
-                session_id = cookie.decode("utf-8")
+        cookie_age = None
+        if cookie_session is not None:
+            data, cookie_age = cookie_session
+            scope["session"] = SessionDict(data, backend=self.backend)
+            await _load_user(scope)
+        elif self.lazy:
+            scope["session"] = LazySessionDict(session_id, backend=self.backend)
+        else:
+            scope["session"] = SessionDict(backend=self.backend)
+            if session_id:
                 if await scope["session"].load(session_id):
-                    logger.info("Session loaded from redis [{}] {}", session_id, scope["session"])
-                    initial_session_was_empty = False
-                    if user_data := scope["session"].get("user"):
-                        scope["user"] = await UserService.load_user_from_session(user_data)
+                    logger.info("Session loaded [{}] {}", session_id, scope["session"])
+                    await _load_user(scope)
                 else:
-                    logger.warning("Session not found in redis {}", session_id)
+                    logger.debug("Session not found {}", session_id)
 
         async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
             if message["type"] == "http.response.start":
-                if scope["session"]:
+                session = scope["session"]
+                stored = session._stored  # pylint: disable=protected-access
+                if session:
                     # We have session data to persist.
-                    headers = MutableHeaders(scope=message)
-                    header_value = (
-                        f"{self.session_cookie}={session_id}; path={self.path}; {f'Max-Age={self.max_age}; ' if self.max_age else ''}"
-                        f"{self.security_flags}"
-                    )
-                    headers.append("Set-Cookie", header_value)
-                    await scope["session"].save(session_id, duration=self.max_age, force=True)
-                elif not initial_session_was_empty:
+                    if self.cookie_max_bytes and (cookie_value := self._cookie_value(session, cookie_age)) is not False:
+                        if cookie_value is not None:
+                            self._set_cookie(message, cookie_value)
+                        if stored:
+                            # The session shrank below the cookie budget.
+                            await session.delete(session_id)
+                        await send(message)
+                        return
+                    if not stored:
+                        # never reuse an id that the backend didn't know about
+                        session_id = self.id_signer.generate()
+                    self._set_cookie(message, session_id)
+                    if not self.sliding_expiry or cookie_age is not None:
+                        await session.save(session_id, duration=self.max_age, force=True)
+                    elif not await session.save(session_id, duration=self.max_age):
+                        await session.touch(session_id, duration=self.max_age, interval=self.touch_interval)
+                elif stored or cookie_age is not None:
                     # The session has been cleared.
                     headers = MutableHeaders(scope=message)
                     header_value = (
@@ -126,8 +357,33 @@ class SessionMiddleware:
                         f"{self.security_flags}"
                     )
                     headers.append("Set-Cookie", header_value)
-                    await scope["session"].delete(session_id)
+                    if stored:
+                        await session.delete(session_id)
                     logger.info("Session [{}] deleted", session_id)
             await send(message)
 
         await self.app(scope, receive, send_wrapper)
+
+    def _cookie_value(self, session: SessionDict, cookie_age: int | None) -> str | None | typing.Literal[False]:
+        """
+        Returns the signed cookie value for the session, None if the current cookie is still fresh and unchanged,
+        or False if the session has outgrown the cookie budget and has to be stored in the backend.
+        """
+        if cookie_age is not None and not session._value_changed:  # pylint: disable=protected-access
+            if self.sliding_expiry and cookie_age < self.touch_interval:
+                return None
+        value = self.cookie_codec.dumps(session)
+        if len(value) > self.cookie_max_bytes:
+            return False
+        return value
+
+    def _set_cookie(self, message: Message, value: str) -> None:
+        headers = MutableHeaders(scope=message)
+        header_value = (
+            f"{self.session_cookie}={value}; path={self.path}; {f'Max-Age={self.max_age}; ' if self.max_age else ''}"
+            f"{self.security_flags}"
+        )
+        headers.append("Set-Cookie", header_value)
+
+    def _is_excluded(self, path: str) -> bool:
+        return any(path == prefix or path.startswith(prefix + "/") for prefix in self.exclude_paths)
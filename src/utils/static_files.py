@@ -0,0 +1,132 @@
+import gzip
+import mimetypes
+import os
+import sys
+import typing
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+if typing.TYPE_CHECKING:
+    from utils.jinja2_templates import AssetManifest
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+__all__ = ["AssetStaticFiles", "ZeroCopyFileResponse", "accepted_encodings", "precompress"]
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Content-Encoding -> file suffix, in order of preference
+_ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+_COMPRESSIBLE_SUFFIXES = {".js", ".css", ".svg", ".json", ".map", ".txt", ".html", ".ttf", ".eot"}
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for value in accept_encoding.split(","):
+        encoding, _, params = value.partition(";")
+        try:
+            if params and float(params.strip().removeprefix("q=")) == 0:
+                continue
+        except ValueError:
+            pass
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+class ZeroCopyFileResponse(FileResponse):
+    """
+    Hands the file to the server through the `http.response.pathsend` or `http.response.zerocopysend` ASGI
+    extensions when available, so it can use sendfile instead of reading the file into python chunk by chunk.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        extensions = scope.get("extensions") or {}
+        if self.send_header_only or self.background is not None or not (
+            "http.response.pathsend" in extensions or "http.response.zerocopysend" in extensions
+        ):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+            return
+        with open(self.path, "rb") as file:
+            await send({"type": "http.response.zerocopysend", "file": file})
+
+
+class AssetStaticFiles(StaticFiles):
+    """
+    `StaticFiles` for the webpack build.
+
+    Paths listed in the asset manifest are content hashed and served as immutable for a year, everything else has
+    to be revalidated. A `.br` or `.gz` sibling written by `precompress` is served instead of the file when the client
+    accepts that encoding.
+    """
+
+    def __init__(self, *, directory: str, manifest: "AssetManifest", **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.manifest = manifest
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        relative_path = Path(os.path.relpath(full_path, self.directory)).as_posix()
+        headers = {"Cache-Control": IMMUTABLE if self.manifest.is_hashed(relative_path) else REVALIDATE}
+        media_type = None
+        if Path(full_path).suffix in _COMPRESSIBLE_SUFFIXES:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in _ENCODINGS.items():
+                if encoding not in accepted:
+                    continue
+                try:
+                    encoded_stat = os.stat(f"{full_path}{suffix}")
+                except OSError:
+                    continue
+                media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+                full_path, stat_result = f"{full_path}{suffix}", encoded_stat
+                headers["Content-Encoding"] = encoding
+                break
+        response = ZeroCopyFileResponse(
+            full_path, status_code=status_code, stat_result=stat_result, method=scope["method"], headers=headers, media_type=media_type
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+def precompress(directory: str | os.PathLike, *, min_size: int = 512) -> int:
+    """
+    Writes `.gz` and, if the brotli package is installed, `.br` siblings for the text assets in `directory`, keeping
+    only those smaller than the original. Returns the number of files written. Run after the frontend build.
+    """
+    written = 0
+    for path in Path(directory).rglob("*"):
+        if not path.is_file() or path.suffix not in _COMPRESSIBLE_SUFFIXES or path.stat().st_size < min_size:
+            continue
+        data = path.read_bytes()
+        variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            target = path.with_name(path.name + suffix)
+            if len(compressed) < len(data):
+                target.write_bytes(compressed)
+                os.utime(target, (path.stat().st_atime, path.stat().st_mtime))
+                written += 1
+            else:
+                target.unlink(missing_ok=True)
+    return written
+
+
+if __name__ == "__main__":
+    # python -m utils.static_files <static folder>
+    print(f"Precompressed {precompress(sys.argv[1])} files")
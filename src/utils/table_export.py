@@ -0,0 +1,50 @@
+import csv
+import io
+import zlib
+from collections.abc import AsyncIterator, Iterable
+from typing import Literal
+
+from sqlalchemy import Table, select
+
+from db.dependencies import create_read_only_session
+from db.engine import orjson_serializer
+
+__all__ = ["ExportFormat", "export_table", "gzip_chunks"]
+
+ExportFormat = Literal["ndjson", "csv"]
+
+
+def _ndjson_chunk(keys: list[str], rows: Iterable) -> bytes:
+    return "".join(orjson_serializer(dict(zip(keys, row))) + "\n" for row in rows).encode()
+
+
+def _csv_chunk(_: list[str], rows: Iterable) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def export_table(table: Table, export_format: ExportFormat, *, batch_size: int = 1000) -> AsyncIterator[bytes]:
+    """
+    Streams all rows of `table` through a server side cursor, one chunk per `batch_size` rows.
+
+    Only one batch is held in memory. The generator is driven by the response, so the next batch is fetched only
+    after the previous chunk was sent and a slow client slows down the cursor instead of filling buffers.
+    """
+    encode = _ndjson_chunk if export_format == "ndjson" else _csv_chunk
+    # orjson only accepts exact str keys, column names may be quoted_name
+    keys = [str(key) for key in table.columns.keys()]
+    if export_format == "csv":
+        yield _csv_chunk(keys, [keys])
+    async with create_read_only_session() as session:
+        result = await session.stream(select(table).execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield encode(keys, rows)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,4 @@
+import os
+
+# settings are read on import, the tests never sign anything that has to outlive the run
+os.environ.setdefault("SECRET_KEY", "test")
@@ -0,0 +1,89 @@
+import asyncio
+import contextlib
+import uuid
+
+import pytest
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from db.models import User, UserSocialAuth
+from dependencies.user_social_auth_service import UserInfo, UserService
+from settings import DatabaseSettings, get_settings
+
+CONCURRENT_LOGINS = 10
+
+
+@contextlib.asynccontextmanager
+async def _database(userinfo: UserInfo):
+    """
+    Yields a session factory for the test database, skipping the test without one, and deletes the rows of `userinfo`
+    afterwards.
+    """
+    engine = create_async_engine(get_settings(DatabaseSettings).url, poolclass=NullPool)
+    try:
+        async with engine.connect() as connection:
+            await asyncio.wait_for(connection.execute(select(1)), timeout=5)
+    except (OSError, asyncio.TimeoutError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres is not available: {e}")
+
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    try:
+        yield session_factory
+    finally:
+        async with session_factory() as session:
+            await session.execute(UserSocialAuth.__table__.delete().where(UserSocialAuth.sub == userinfo.sub))
+            await session.execute(User.__table__.delete().where(User.email == userinfo.email))
+            await session.commit()
+        await engine.dispose()
+
+
+def _userinfo() -> UserInfo:
+    sub = uuid.uuid4().hex
+    return UserInfo(sub=sub, name="Race", email=f"race-{sub}@example.com", locale="en")
+
+
+async def _count_rows(session, userinfo: UserInfo) -> tuple[int, int]:
+    user_count = await session.scalar(select(func.count()).select_from(User).where(User.email == userinfo.email))
+    auth_count = await session.scalar(
+        select(func.count()).select_from(UserSocialAuth).where(UserSocialAuth.service == "google", UserSocialAuth.sub == userinfo.sub)
+    )
+    return user_count, auth_count
+
+
+async def _concurrent_first_login() -> None:
+    userinfo = _userinfo()
+    async with _database(userinfo) as session_factory:
+
+        async def login():
+            async with session_factory() as session:
+                return await UserService(session).login_or_create_user(service="google", userinfo=userinfo)
+
+        users = await asyncio.gather(*(login() for _ in range(CONCURRENT_LOGINS)))
+        async with session_factory() as session:
+            assert await _count_rows(session, userinfo) == (1, 1)
+        assert len({user.id for user in users}) == 1
+
+
+async def _first_login_of_disabled_user() -> None:
+    userinfo = _userinfo()
+    async with _database(userinfo) as session_factory:
+        async with session_factory() as session:
+            await session.execute(insert(User).values(email=userinfo.email, active=False))
+            await session.commit()
+
+        async with session_factory() as session:
+            with pytest.raises(UserService.UserDisabled):
+                await UserService(session).login_or_create_user(service="google", userinfo=userinfo)
+
+        async with session_factory() as session:
+            assert await _count_rows(session, userinfo) == (1, 0)
+
+
+def test_concurrent_first_login_creates_one_user():
+    asyncio.run(_concurrent_first_login())
+
+
+def test_first_login_of_disabled_user_links_nothing():
+    asyncio.run(_first_login_of_disabled_user())